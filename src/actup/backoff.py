@@ -0,0 +1,63 @@
+import random
+import time
+from collections.abc import Callable
+from datetime import UTC
+from email.utils import parsedate_to_datetime
+from functools import wraps
+from typing import Any
+
+from actup.logger import logger
+
+RATE_LIMIT_STATUS_CODES = (403, 429)
+
+
+def _rate_limit_wait(error: Exception) -> float | None:
+    """Get the number of seconds GitHub asked us to wait, if the error is a rate-limited HTTP response."""
+    response = getattr(error, "response", None)
+    if response is None or response.status_code not in RATE_LIMIT_STATUS_CODES:
+        return None
+
+    headers = response.headers
+    if "retry-after" in headers:
+        retry_after = headers["retry-after"]
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass
+        # `Retry-After` may also be an HTTP-date, which is always in GMT
+        try:
+            retry_at = parsedate_to_datetime(retry_after).replace(tzinfo=UTC)
+            return max(0.0, retry_at.timestamp() - time.time())
+        except (TypeError, ValueError):
+            logger.debug(f"Ignoring unparseable Retry-After header: {retry_after!r}")
+    if headers.get("x-ratelimit-remaining") == "0" and "x-ratelimit-reset" in headers:
+        return max(0.0, float(headers["x-ratelimit-reset"]) - time.time())
+    return None
+
+
+def retry_with_backoff(tries: int = 3, delay: float = 1.0, max_delay: float = 60.0) -> Callable:
+    """Retry a function with jittered exponential backoff.
+
+    When the failure is a GitHub rate-limit response, waits for exactly as long as the `Retry-After` or
+    `X-RateLimit-Reset` headers require instead.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            for attempt in range(1, tries + 1):
+                try:
+                    return func(*args, **kwargs)
+                except Exception as e:
+                    if attempt == tries:
+                        raise
+                    wait = _rate_limit_wait(e)
+                    if wait is None:
+                        backoff = min(max_delay, delay * 2 ** (attempt - 1))
+                        wait = random.uniform(backoff / 2, backoff)
+                    logger.warning(f"{e}, retrying in {wait:.1f} seconds...")
+                    time.sleep(wait)
+
+        return wrapper
+
+    return decorator
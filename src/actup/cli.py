@@ -1,25 +1,36 @@
 import logging
-import shutil
-from multiprocessing import Pool, cpu_count
+from functools import cache
 from pathlib import Path
+from typing import TYPE_CHECKING
 
 import typer
-from retry import retry
-from tqdm import tqdm
 
+from actup.backoff import retry_with_backoff
 from actup.config import settings
-from actup.database import Database
-from actup.github_api import GitHubAPIClient
-from actup.github_public import GitHubPublicClient
 from actup.logger import logger
-from actup.models import GitHubAction, GitHubRepo
-from actup.pr_creator import PullRequestCreator
-from actup.tracker import update_pr_statuses
-from actup.utils import git_clone_sparse, search_and_extract_actions
+
+# Heavy modules (duckdb, httpx, requests, GitPython, ollama) are imported inside the commands that use them,
+# so `actup --help` and simple commands do not pay for them
+if TYPE_CHECKING:
+    from actup.github_api import GitHubAPIClient
+    from actup.github_public import GitHubPublicClient
+    from actup.models import GitHubRepo
 
 app = typer.Typer()
-client_api = GitHubAPIClient()
-client_public = GitHubPublicClient()
+
+
+@cache
+def _api_client() -> "GitHubAPIClient":
+    from actup.github_api import GitHubAPIClient
+
+    return GitHubAPIClient()
+
+
+@cache
+def _public_client() -> "GitHubPublicClient":
+    from actup.github_public import GitHubPublicClient
+
+    return GitHubPublicClient()
 
 
 @app.command()
@@ -27,9 +38,11 @@ def create_prs(
     pin_to_sha: bool = typer.Option(False, "--pin-to-sha", help="Pin actions to commit SHAs instead of version tags."),
 ):
     """Create Pull Requests for outdated actions."""
-    db = Database()
-    outdated = db.get_outdated_mentions()
-    db.close()
+    from actup.database import get_db
+    from actup.pr_creator import PullRequestCreator
+
+    with get_db() as db:
+        outdated = db.get_outdated_mentions_grouped()
 
     if not outdated:
         logger.info("No outdated actions found. Did you run find-outdated-actions?")
@@ -38,12 +51,14 @@ def create_prs(
     if pin_to_sha:
         logger.info("Mode: Pinning actions to commit SHAs")
 
-    creator = PullRequestCreator(client=client_api)
+    creator = PullRequestCreator(client=_api_client())
     creator.create_prs(outdated, pin_to_sha=pin_to_sha)
 
 
-@retry(delay=3, tries=2)
+@retry_with_backoff(tries=2, delay=3)
 def _fetch_repo_contents(repo_data):
+    from actup.utils import git_fetch_workflow_files
+
     repo_full_name = repo_data.repo_full_name
     repo_url = repo_data.clone_url
     repo_dir = Path(settings.temp_dir) / "cloned_repos" / repo_full_name.replace("/", "_")
@@ -51,37 +66,55 @@ def _fetch_repo_contents(repo_data):
         logger.debug(f"Skipping {repo_full_name} - already cloned")
         return
     logger.info(f"Cloning {repo_url}...")
-    git_clone_sparse(repo_url=repo_url, final_target_dir=str(repo_dir))
+    git_fetch_workflow_files(repo_url=repo_url, final_target_dir=str(repo_dir))
+
+
+async def _fetch_all_repo_contents(repos: list["GitHubRepo"]) -> None:
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+
+    from tqdm.asyncio import tqdm_asyncio
+
+    # Fetching is network-bound, so threads driven from the event loop replace forked worker processes
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=settings.clone_concurrency) as executor:
+        await tqdm_asyncio.gather(
+            *(loop.run_in_executor(executor, _fetch_repo_contents, repo) for repo in repos),
+            total=len(repos),
+            desc="Fetching Repos",
+        )
 
 
 @app.command()
 def fetch_repos(force: bool = typer.Option(False, "--force", help="Re-fetch repos that are already cloned.")):
     """Fetch popular repositories contents."""
+    import asyncio
+    import shutil
+
+    from actup.database import get_db
+
     if force:
         shutil.rmtree(Path(settings.temp_dir) / "cloned_repos", ignore_errors=True)
 
-    db = Database()
-    known_repos = db.get_popular_repos()
-    db.close()
+    with get_db() as db:
+        known_repos = db.get_popular_repos()
     if not known_repos:
         raise RuntimeError("No known repos found. Run find-repos first.")
 
-    with Pool(processes=cpu_count()) as pool:
-        for _ in tqdm(
-            pool.imap_unordered(_fetch_repo_contents, known_repos), total=len(known_repos), desc="Fetching Repos"
-        ):
-            pass
+    asyncio.run(_fetch_all_repo_contents(known_repos))
 
 
 @app.command()
 def find_actions(limit: int = settings.popular_actions_limit):
     """Fetch popular GitHub Actions and their latest major versions."""
-    logger.info(f"Searching for top {limit} popular actions...")
-    actions = client_public.search_popular_actions(limit)
-    db = Database()
-    db.truncate_actions()
+    from actup.database import get_db
+    from actup.models import GitHubAction
 
-    for i, repo_data in enumerate(actions, start=1):
+    client_api = _api_client()
+    logger.info(f"Searching for top {limit} popular actions...")
+    actions = _public_client().search_popular_actions(limit)
+    popular_actions = []
+    for repo_data in actions:
         name = repo_data["name"]
         owner = repo_data["owner"]
         repo_name = repo_data["repo"]
@@ -96,101 +129,120 @@ def find_actions(limit: int = settings.popular_actions_limit):
             latest_version=latest_version,
             latest_major_version=latest_major,
         )
-        db.save_popular_action(action)
-    db.close()
+        popular_actions.append(action)
+
+    with get_db() as db, db.transaction():
+        db.truncate_actions()
+        db.save_popular_actions(popular_actions)
 
 
 @app.command()
 def find_outdated_actions():
     """Find outdated actions."""
-    db = Database()
-    db.find_outdated_actions()
-    db.close()
+    from actup.database import get_db
+
+    with get_db() as db:
+        db.find_outdated_actions()
 
 
 @app.command()
-def find_action_shas():
+def find_action_shas(
+    refresh: bool = typer.Option(
+        False, "--refresh", help="Re-check already processed actions for new tags using conditional requests."
+    ),
+):
     """Resolve action version tags to commit SHAs for ALL releases."""
-    db = Database()
-    actions = db.get_popular_actions()
-    db.close()
+    from tqdm import tqdm
 
-    if not actions:
-        logger.info("No popular actions found. Run find-actions first.")
-        return
-
-    db = Database()
-    actions_to_process = []
-    skipped = 0
+    from actup.database import INSERT_BATCH_SIZE, get_db
 
-    for action in actions:
-        action_key = f"{action.owner}/{action.repo}"
-        if db.has_action_tags(action_key):
-            skipped += 1
-            logger.debug(f"Skipping {action_key} - already processed")
-        else:
-            actions_to_process.append(action)
+    client_api = _api_client()
+    with get_db() as db:
+        actions = db.get_popular_actions()
 
-    db.close()
+        if not actions:
+            logger.info("No popular actions found. Run find-actions first.")
+            return
 
-    logger.info(f"Resolving commit SHAs for {len(actions_to_process)} actions ({skipped} already processed)...")
-
-    if not actions_to_process:
-        logger.info("All actions already processed.")
-        return
-
-    db = Database()
-
-    for action in tqdm(actions_to_process, desc="Resolving SHAs"):
-        tags = client_api.get_tags(action.owner, action.repo)
-        action_key = f"{action.owner}/{action.repo}"
-        for tag in tags:
-            tag_name = tag.get("name")
-            tag_sha = tag.get("commit", {}).get("sha")
-            if tag_name and tag_sha:
-                db.save_action_tag(action_key, tag_name, tag_sha)
-                logger.debug(f"Resolved {action.name}@{tag_name} -> {tag_sha[:7]}")
+        processed = db.get_actions_with_tags()
+        if refresh:
+            actions_to_process = actions
+        else:
+            actions_to_process = [a for a in actions if f"{a.owner}/{a.repo}" not in processed]
+        skipped = len(actions) - len(actions_to_process)
+
+        logger.info(f"Resolving commit SHAs for {len(actions_to_process)} actions ({skipped} already processed)...")
+
+        if not actions_to_process:
+            logger.info("All actions already processed.")
+            return
+
+        etags = db.get_action_tag_etags()
+        # Rows are buffered and flushed in bulk rather than issuing statements per action
+        action_tags: list[tuple[str, str, str]] = []
+        new_etags: list[tuple[str, str]] = []
+        with db.transaction():
+            for action in tqdm(actions_to_process, desc="Resolving SHAs"):
+                action_key = f"{action.owner}/{action.repo}"
+                etag, tags = client_api.get_tags_if_modified(action.owner, action.repo, etag=etags.get(action_key))
+                if tags is None:
+                    logger.debug(f"Tags for {action_key} unchanged since last run")
+                    continue
+
+                for tag in tags:
+                    tag_name = tag.get("name")
+                    tag_sha = tag.get("commit", {}).get("sha")
+                    if tag_name and tag_sha:
+                        action_tags.append((action_key, tag_name, tag_sha))
+                        logger.debug(f"Resolved {action.name}@{tag_name} -> {tag_sha[:7]}")
+                if etag:
+                    new_etags.append((action_key, etag))
+                if len(action_tags) >= INSERT_BATCH_SIZE:
+                    db.save_action_tags(action_tags)
+                    action_tags = []
+
+            db.save_action_tags(action_tags)
+            db.save_action_tag_etags(new_etags)
 
-    db.close()
     logger.info("Done resolving commit SHAs for all releases.")
 
 
 @app.command()
 def find_repos(limit: int = settings.popular_repos_limit):
     """Find popular repositories."""
+    import json
+    import tempfile
+
+    from actup.database import get_db
+
     logger.info(f"Searching for top {limit} popular repositories...")
-    repos = client_api.search_popular_repositories(limit)
-    db = Database()
-    db.truncate_repositories()
-
-    for repo_data in repos:
-        repo_full_name = repo_data["full_name"]
-        clone_url = repo_data["clone_url"]
-        stars = repo_data["stargazers_count"]
-        archived = repo_data["archived"]
-        pushed_at = repo_data["pushed_at"]
-        fork = repo_data["fork"]
-        size = repo_data["size"]
-
-        action = GitHubRepo(
-            repo_full_name=repo_full_name,
-            clone_url=clone_url,
-            stars=stars,
-            archived=archived,
-            pushed_at=pushed_at,
-            fork=fork,
-            size=size,
-        )
-        db.save_popular_repo(action)
-    db.close()
+    # Each repo is written out as its page arrives, then DuckDB loads the whole file in one statement
+    with tempfile.NamedTemporaryFile("w", suffix=".ndjson", delete_on_close=False) as f:
+        for repo_data in _api_client().iter_popular_repositories(limit):
+            record = {
+                "repo_full_name": repo_data["full_name"],
+                "clone_url": repo_data["clone_url"],
+                "stars": repo_data["stargazers_count"],
+                "archived": repo_data["archived"],
+                "pushed_at": repo_data["pushed_at"],
+                "fork": repo_data["fork"],
+                "size": repo_data["size"],
+            }
+            f.write(json.dumps(record) + "\n")
+        f.close()
+
+        with get_db() as db, db.transaction():
+            db.truncate_repositories()
+            db.save_popular_repos_json(f.name)
 
 
 @app.command()
 def init_db():
     """Initialize the DuckDB database schema."""
-    db = Database()
-    db.close()
-    logger.info(f"Database initialized at {db.db_file}")
+    from actup.database import get_db
+
+    with get_db() as db:
+        logger.info(f"Database initialized at {db.db_file}")
 
 
 @app.callback()
@@ -203,16 +255,27 @@ def main(verbose: bool = typer.Option(False, "-v", "--verbose", help="Enable ver
 @app.command()
 def report():
     """Update the list of created PRs with their status."""
-    update_pr_statuses(client_api)
+    from actup.tracker import update_pr_statuses
+
+    update_pr_statuses(_api_client())
 
 
 @app.command()
-def scan_repos():
+def scan_repos(
+    force: bool = typer.Option(False, "--force", help="Re-scan repos that are unchanged since their last scan."),
+):
     """Scan popular repositories for outdated action usage."""
-    db = Database()
-    known_actions = {a.name: a.latest_major_version for a in db.get_popular_actions()}
-    known_repos = db.get_popular_repos()
-    db.close()
+    import sys
+    from multiprocessing import cpu_count, get_context
+
+    from tqdm import tqdm
+
+    from actup.database import get_db
+    from actup.utils import is_scan_current, search_and_extract_actions
+
+    with get_db() as db:
+        known_actions = db.get_popular_action_versions()
+        known_repos = db.get_popular_repo_names()
     if not known_actions:
         raise RuntimeError("No known actions found. Run find-actions first.")
     if not known_repos:
@@ -220,15 +283,26 @@ def scan_repos():
     if not (Path(settings.temp_dir) / "cloned_repos").exists():
         raise RuntimeError("No cloned repos found. Run fetch-repos first.")
 
-    with Pool(processes=cpu_count()) as pool:
+    repos_to_scan = [r for r in known_repos if force or not is_scan_current(r)]
+    logger.info(
+        f"Scanning {len(repos_to_scan)} repos ({len(known_repos) - len(repos_to_scan)} unchanged since last scan)."
+    )
+
+    processes = cpu_count()
+    chunksize = max(1, len(repos_to_scan) // (processes * 4))
+    # Forked workers inherit the already-imported modules and loaded settings instead of re-importing them. Fork is
+    # unavailable on Windows and unsafe on macOS once threads are running, so other platforms keep their default.
+    context = get_context("fork") if sys.platform == "linux" else get_context()
+    with context.Pool(processes=processes) as pool:
         for _ in tqdm(
-            pool.imap_unordered(search_and_extract_actions, known_repos), total=len(known_repos), desc="Scanning Repos"
+            pool.imap_unordered(search_and_extract_actions, repos_to_scan, chunksize=chunksize),
+            total=len(repos_to_scan),
+            desc="Scanning Repos",
         ):
             pass
 
-    db = Database()
-    db.save_used_actions()
-    db.close()
+    with get_db() as db:
+        db.save_used_actions()
 
 
 if __name__ == "__main__":
@@ -1,20 +1,31 @@
+from functools import cache
+
 import yaml
 from pydantic import BaseModel
 
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:  # PyYAML built without libyaml
+    from yaml import SafeLoader
+
 
 class Config(BaseModel):
     """Configuration settings for the application."""
 
+    clone_concurrency: int = 64  # Clones are network-bound, so this can be well above the number of CPU cores
+    duckdb_memory_limit: str | None = None  # e.g. "4GB"; DuckDB defaults to 80% of system memory
+    duckdb_threads: int | None = None  # DuckDB defaults to the number of CPU cores
     exclude_repos: list[str] = []
     popular_actions_limit: int
     popular_repos_limit: int
     temp_dir: str
 
     @classmethod
+    @cache
     def load(cls, path: str = "config.yaml") -> "Config":
         """Load configuration from a YAML file."""
         with open(path, "r") as f:
-            data = yaml.safe_load(f)
+            data = yaml.load(f, Loader=SafeLoader)
         return cls(**data)
 
 
@@ -1,23 +1,158 @@
-from datetime import datetime
+import atexit
+import json
+import tempfile
+from collections.abc import Generator
+from contextlib import contextmanager
+from datetime import UTC, datetime
 from functools import cache
 from pathlib import Path
+from typing import Any
 
 import duckdb
+from pydantic import BaseModel
 
 from actup.config import settings
 from actup.logger import logger
 from actup.models import GitHubAction, GitHubRepo, PullRequestRecord, RepositoryMention
-from actup.utils import is_major_version_outdated
+
+_OUTDATED_MENTIONS_QUERY = """
+    SELECT
+        oa.repo_full_name,
+        oa.action_name,
+        oa.action_version AS detected_version,
+        oa.filepath AS file_path,
+        oa.line_number,
+        pa.latest_version,
+        oa.is_outdated,
+        pr.stars,
+        tag.commit_sha
+    FROM outdated_actions oa
+    LEFT JOIN popular_repositories pr ON pr.repo_full_name = oa.repo_full_name
+    LEFT JOIN popular_actions pa ON pa.action_name = oa.action_name
+    LEFT JOIN action_tags tag ON tag.action_name = oa.action_name AND tag.tag = oa.action_version
+    LEFT JOIN pull_request_exclusions pre ON pre.repo_full_name = oa.repo_full_name
+    LEFT JOIN repo_update_locks rul ON rul.repo_full_name = oa.repo_full_name
+    LEFT JOIN action_exclusions ae ON ae.action_name = oa.action_name
+    WHERE
+        oa.is_outdated IS TRUE
+        AND pre.repo_full_name IS NULL -- i.e. Do not include excluded repos
+        AND rul.repo_full_name IS NULL -- i.e. Do not include repos that do not accept our PRs
+        AND ae.action_name IS NULL -- i.e. Do not include actions we do not update
+"""
+
+# Seed rows for `repo_update_locks` and `action_exclusions`, upserted on every start so edits here reach existing
+# databases. Rows added to those tables by hand are kept
+_REPO_UPDATE_LOCKS = {
+    "ant-design/ant-design": "Updates locked to maintainers",
+    "expo/expo": "Updates locked to maintainers",
+    "tldraw/tldraw": "Updates locked to maintainers",
+    "gorhill/uBlock": "Unable to open PRs",
+    "AUTOMATIC1111/stable-diffusion-webui": "Autoclosed PRs",
+    "alacritty/alacritty": "Unfriendly to automated improvements",
+    "pocketbase/pocketbase": "Unfriendly to automated improvements",
+    "RVC-Boss/GPT-SoVITS": "Unfriendly to automated improvements",
+    "Significant-Gravitas/AutoGPT": "Unfriendly to automated improvements",
+}
+_ACTION_EXCLUSIONS = {
+    "actions/labeler": "Contains breaking change in v5",
+}
+
+INSERT_BATCH_SIZE = 10_000
+# Smaller batches are bound as parameters, as writing and reading a JSON file costs more than it saves for them
+JSON_LOAD_MIN_ROWS = 100
+
+
+def _naive_utc(value: Any) -> Any:
+    """Convert a timezone-aware datetime to naive UTC, as DuckDB would otherwise bind it in the session's time zone."""
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.astimezone(UTC).replace(tzinfo=None)
+    return value
+
+
+def _json_default(value: Any) -> str:
+    """Encode datetimes for `read_json`, storing timezone-aware values as naive UTC like bound rows are."""
+    if isinstance(value, datetime):
+        return _naive_utc(value).isoformat(sep=" ")
+    raise TypeError(f"Cannot encode {type(value).__name__} as JSON")
 
 
 class Database:
-    """A wrapper for the DuckDB database."""
+    """A wrapper for the DuckDB database.
+
+    Connections are shared per database file, so the schema is only initialised the first time a file is opened.
+    """
+
+    _connections: dict[str, duckdb.DuckDBPyConnection] = {}
 
     def __init__(self, db_file: str | None = None):
         """Initialize the database connection."""
         self.db_file = db_file if db_file is not None else "./actup.duckdb"
-        self.con = duckdb.connect(self.db_file)
-        self.init_db()
+        con = self._connections.get(self.db_file)
+        if con is None:
+            config: dict[str, Any] = {}
+            if settings.duckdb_threads is not None:
+                config["threads"] = settings.duckdb_threads
+            if settings.duckdb_memory_limit is not None:
+                config["memory_limit"] = settings.duckdb_memory_limit
+            self.con = self._connections[self.db_file] = duckdb.connect(self.db_file, config=config)
+            self.init_db()
+        else:
+            self.con = con
+
+    def _count(self, query: str) -> int:
+        """Run a `SELECT COUNT(*)` query, fetching its single row directly."""
+        (count,) = self.con.execute(query).fetchone() or (0,)
+        return count
+
+    def _fetch_models[T: BaseModel](self, model: type[T], query: str, parameters: Any = None) -> list[T]:
+        """Build models from query rows by column name, skipping validation of data already typed by DuckDB.
+
+        Every row sets the same fields, so the models share one `fields_set` instead of allocating a set each.
+        """
+        cursor = self.con.execute(query, parameters)
+        columns = [column[0] for column in cursor.description]
+        fields_set = {column for column in columns if column in model.model_fields}
+        return [model.model_construct(fields_set, **dict(zip(columns, row))) for row in cursor.fetchall()]
+
+    def _insert_or_replace_rows(
+        self,
+        table: str,
+        columns: dict[str, str],
+        key: tuple[str, ...],
+        rows: list[tuple],
+        order_by: str | None = None,
+    ) -> None:
+        """Bulk insert or replace rows by loading them through `read_json`, flushing every `INSERT_BATCH_SIZE` rows.
+
+        Binding Python parameters costs far more per value than DuckDB's JSON reader, so this stands in for the
+        Appender that the Python client only exposes for DataFrames. Each batch is written sorted by `order_by`.
+        Fewer than `JSON_LOAD_MIN_ROWS` rows are bound as parameters instead. Either way, timezone-aware datetimes
+        are stored as naive UTC.
+        """
+        names = list(columns)
+        if len(rows) < JSON_LOAD_MIN_ROWS:
+            self.con.executemany(
+                f"INSERT OR REPLACE INTO {table} ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})",
+                [tuple(map(_naive_utc, row)) for row in rows],
+            )
+            return
+
+        key_indexes = [names.index(name) for name in key]
+        # Within one statement DuckDB keeps the first of several rows sharing a key; keep the last, like per-row inserts
+        rows = list({tuple(row[i] for i in key_indexes): row for row in rows}.values())
+        column_types = ", ".join(f"{name}: '{column_type}'" for name, column_type in columns.items())
+        for start in range(0, len(rows), INSERT_BATCH_SIZE):
+            with tempfile.NamedTemporaryFile("w", suffix=".json", delete_on_close=False) as f:
+                json.dump(
+                    [dict(zip(names, row)) for row in rows[start : start + INSERT_BATCH_SIZE]], f, default=_json_default
+                )
+                f.close()
+                self.con.execute(
+                    f"INSERT OR REPLACE INTO {table} ({', '.join(names)}) "
+                    f"SELECT {', '.join(names)} FROM read_json(?, columns = {{{column_types}}})"
+                    + (f" ORDER BY {order_by}" if order_by else ""),
+                    (f.name,),
+                )
 
     def add_repo_to_pr_exclusions(self, repo_full_name: str) -> None:
         """Add a repo to the pr_exclusions table."""
@@ -30,30 +165,29 @@ class Database:
 
     def close(self):
         """Close the database connection."""
+        self._connections.pop(self.db_file, None)
         self.con.close()
 
-    def find_outdated_actions(self) -> None:
-        """Save outdated actions."""
-        actions = self.con.query("""
-            SELECT DISTINCT
-                au.repo_full_name,
-                au.action_name,
-                au.action_version,
-                au.filepath,
-                au.line_number,
-                pa.latest_major_version
-            FROM action_usage au
-            LEFT JOIN popular_actions pa ON CONCAT(pa.owner, '/', pa.repo) = au.action_name
-            WHERE
-                SUBSTRING(au.action_version, 1, 1) = 'v'
-                AND au.line_number <> -1 -- Denotes unknowns
-        """).fetchall()
+    @classmethod
+    def close_all(cls) -> None:
+        """Close every shared database connection."""
+        for con in cls._connections.values():
+            con.close()
+        cls._connections.clear()
 
-        for i in range(len(actions)):
-            actions[i] = actions[i] + (
-                is_major_version_outdated(detected_version=actions[i][2], latest_version=actions[i][5]),
-            )
+    @contextmanager
+    def transaction(self) -> Generator["Database"]:
+        """Run the enclosed statements in a single transaction, rolling back on error."""
+        self.con.begin()
+        try:
+            yield self
+        except Exception:
+            self.con.rollback()
+            raise
+        self.con.commit()
 
+    def find_outdated_actions(self) -> None:
+        """Save outdated actions."""
         self.con.execute("DROP TABLE IF EXISTS outdated_actions;")
         self.con.execute("""
             CREATE TABLE outdated_actions (
@@ -67,275 +201,433 @@ class Database:
                 PRIMARY KEY (repo_full_name, filepath, line_number)
             );
         """)
-        self.con.executemany("INSERT INTO outdated_actions VALUES (?, ?, ?, ?, ?, ?, ?);", actions)
-        num_action_usages = self.con.execute(
-            "SELECT COUNT(*) FROM outdated_actions WHERE is_outdated IS TRUE"
-        ).fetchall()[0][0]
+        # Compare leading version numbers, false if either is missing
+        self.con.execute("""
+            INSERT INTO outdated_actions
+            SELECT
+                *,
+                COALESCE(
+                    TRY_CAST(SPLIT_PART(LTRIM(action_version, 'v'), '.', 1) AS BIGINT)
+                    < TRY_CAST(SPLIT_PART(LTRIM(latest_major_version, 'v'), '.', 1) AS BIGINT),
+                    FALSE
+                ) AS is_outdated
+            FROM (
+                SELECT DISTINCT
+                    au.repo_full_name,
+                    au.action_name,
+                    au.action_version,
+                    au.filepath,
+                    au.line_number,
+                    pa.latest_major_version
+                FROM action_usage au
+                LEFT JOIN popular_actions pa ON pa.action_name = au.action_name
+                WHERE
+                    SUBSTRING(au.action_version, 1, 1) = 'v'
+                    AND au.line_number <> -1 -- Denotes unknowns
+            )
+        """)
+        num_action_usages = self._count("SELECT COUNT(*) FROM outdated_actions WHERE is_outdated IS TRUE")
         logger.info(f"Found {num_action_usages} outdated actions. Saved to `outdated_actions`.")
 
-    def get_outdated_mentions(self) -> list[RepositoryMention]:
-        """Get all outdated action mentions."""
-        res = self.con.execute("""
+    def get_outdated_mentions_grouped(self) -> dict[str, list[RepositoryMention]]:
+        """Get all outdated action mentions, grouped by repository in the database."""
+        res = self.con.execute(f"""
             SELECT
-                oa.repo_full_name,
-                oa.action_name,
-                oa.action_version,
-                oa.filepath,
-                oa.line_number,
-                pa.latest_version,
-                oa.is_outdated,
-                pr.stars,
-                tag.commit_sha
-            FROM outdated_actions oa
-            LEFT JOIN popular_repositories pr ON pr.repo_full_name = oa.repo_full_name
-            LEFT JOIN popular_actions pa ON CONCAT(pa.owner, '/', pa.repo) = oa.action_name
-            LEFT JOIN action_tags tag ON tag.action_name = oa.action_name AND tag.tag = oa.action_version
-            LEFT JOIN pull_request_exclusions pre ON pre.repo_full_name = oa.repo_full_name
-            WHERE
-                oa.is_outdated IS TRUE
-                AND pre.repo_full_name IS NULL -- i.e. Do not include excluded repos
-                AND oa.repo_full_name NOT IN (
-                    -- Updates locked to maintainers
-                    'ant-design/ant-design',
-                    'expo/expo',
-                    'tldraw/tldraw',
-
-                    -- unable to open PRs
-                    'gorhill/uBlock',
-
-                    -- Autoclosed PRs
-                    'AUTOMATIC1111/stable-diffusion-webui',
-
-                    -- unfriendly to automated improvements
-                    'alacritty/alacritty',
-                    'pocketbase/pocketbase',
-                    'RVC-Boss/GPT-SoVITS',
-                    'Significant-Gravitas/AutoGPT'
-                )
-                AND oa.action_name != 'actions/labeler' -- Contains breaking change in v5
-            ORDER BY pr.stars asc -- desc
+                m.repo_full_name,
+                list(m ORDER BY m.file_path, m.line_number) AS mentions
+            FROM ({_OUTDATED_MENTIONS_QUERY}) m
+            GROUP BY m.repo_full_name
+            ORDER BY any_value(m.stars) asc -- desc
         """).fetchall()
-        return [
-            RepositoryMention(
-                repo_full_name=r[0],
-                action_name=r[1],
-                detected_version=r[2],
-                file_path=r[3],
-                line_number=r[4],
-                latest_version=r[5],
-                is_outdated=r[6],
-                stars=r[7],
-                commit_sha=r[8] if len(r) > 8 else None,
-            )
-            for r in res
-        ]
+        fields_set = set(RepositoryMention.model_fields)
+        return {
+            repo_full_name: [RepositoryMention.model_construct(fields_set, **mention) for mention in mentions]
+            for repo_full_name, mentions in res
+        }
 
     @cache
     def get_popular_actions(self) -> list[GitHubAction]:
         """Get all popular actions."""
-        res = self.con.execute(
-            "SELECT * FROM popular_actions WHERE latest_major_version IS NOT NULL ORDER BY stars DESC"
-        ).fetchall()
-        logger.info(f"Retrieved {len(res)} actions.")
-        return [
-            GitHubAction(
-                name=r[0],
-                owner=r[1],
-                repo=r[2],
-                stars=int(r[3]),
-                latest_version=r[4],
-                latest_major_version=r[5],
-                commit_sha=r[6] if len(r) > 6 else None,
-                checked_at=r[7] if len(r) > 7 else None,
-            )
-            for r in res
-        ]
+        actions = self._fetch_models(
+            GitHubAction, "SELECT * FROM popular_actions WHERE latest_major_version IS NOT NULL ORDER BY stars DESC"
+        )
+        logger.info(f"Retrieved {len(actions)} actions.")
+        return actions
 
-    @cache
-    def get_popular_repos(self) -> list[GitHubRepo]:
-        """Get all popular repos."""
-        res = self.con.execute(
-            "SELECT * FROM popular_repositories WHERE repo_full_name "
-            f"NOT IN ('{"', '".join(settings.exclude_repos)}') "
+    def get_popular_action_versions(self) -> dict[str, str]:
+        """Get the latest major version of each popular action, keyed by action name."""
+        return dict(
+            self.con.execute(
+                "SELECT name, latest_major_version FROM popular_actions WHERE latest_major_version IS NOT NULL"
+            ).fetchall()
+        )
+
+    def _popular_repos_query(self, columns: str) -> str:
+        """Build a query selecting the given columns of the popular repos worth processing, most starred first."""
+        return (
+            f"SELECT {columns} FROM popular_repositories pr "
+            "WHERE NOT EXISTS (SELECT 1 FROM repo_exclusions e WHERE e.repo_full_name = pr.repo_full_name) "
             "AND archived IS False "
             "AND fork IS FALSE "
             "AND pushed_at >= CURRENT_DATE - INTERVAL '6 months' "
-            "ORDER BY stars DESC",
-        ).fetchall()
-        logger.info(f"Retrieved {len(res)} repos.")
-        return [
-            GitHubRepo(
-                repo_full_name=r[0],
-                clone_url=r[1],
-                stars=int(r[2]),
-                archived=r[3],
-                pushed_at=r[4],
-                fork=r[5],
-                size=r[6],
-                checked_at=r[7],
-            )
-            for r in res
-        ]
+            "ORDER BY stars DESC"
+        )
 
-    def init_db(self):
-        """Initialise the database tables."""
-        self.con.execute("""
-            CREATE TABLE IF NOT EXISTS action_mentions (
-                repo_full_name VARCHAR,
-                file_path VARCHAR,
-                line_number INTEGER,
-                action_name VARCHAR,
-                detected_version VARCHAR,
-                latest_version VARCHAR,
-                is_outdated BOOLEAN,
-                commit_sha VARCHAR,
-                PRIMARY KEY (repo_full_name, file_path, line_number)
-            );
-        """)
-        self.con.execute("""
-            CREATE TABLE IF NOT EXISTS popular_actions (
-                name VARCHAR PRIMARY KEY,
-                owner VARCHAR,
-                repo VARCHAR,
-                stars INTEGER,
-                latest_version VARCHAR,
-                latest_major_version VARCHAR,
-                commit_sha VARCHAR,
-                checked_at TIMESTAMP
-            );
-        """)
+    @cache
+    def get_popular_repos(self) -> list[GitHubRepo]:
+        """Get all popular repos."""
+        repos = self._fetch_models(GitHubRepo, self._popular_repos_query("*"))
+        logger.info(f"Retrieved {len(repos)} repos.")
+        return repos
 
-        try:
-            self.con.execute("ALTER TABLE popular_actions ADD COLUMN commit_sha VARCHAR")
-        except Exception:
-            pass
+    def get_popular_repo_names(self) -> list[str]:
+        """Get the full names of all popular repos, without building a model per row."""
+        return [name for (name,) in self.con.execute(self._popular_repos_query("repo_full_name")).fetchall()]
 
-        try:
+    def init_db(self):
+        """Initialise the database tables, skipping DDL for tables and columns that already exist."""
+        existing_columns = set(
+            self.con.execute(
+                "SELECT table_name, column_name FROM information_schema.columns WHERE table_schema = 'main'"
+            ).fetchall()
+        )
+        existing_tables = {table_name for table_name, _ in existing_columns}
+
+        if "action_mentions" not in existing_tables:
+            self.con.execute("""
+                CREATE TABLE action_mentions (
+                    repo_full_name VARCHAR,
+                    file_path VARCHAR,
+                    line_number INTEGER,
+                    action_name VARCHAR,
+                    detected_version VARCHAR,
+                    latest_version VARCHAR,
+                    is_outdated BOOLEAN,
+                    commit_sha VARCHAR,
+                    PRIMARY KEY (repo_full_name, file_path, line_number)
+                );
+            """)
+        elif ("action_mentions", "commit_sha") not in existing_columns:
             self.con.execute("ALTER TABLE action_mentions ADD COLUMN commit_sha VARCHAR")
-        except Exception:
-            pass
 
-        self.con.execute("""
-            CREATE TABLE IF NOT EXISTS action_tags (
-                action_name VARCHAR,
-                tag VARCHAR,
-                commit_sha VARCHAR,
-                PRIMARY KEY (action_name, tag)
-            );
-        """)
+        if "popular_actions" not in existing_tables:
+            self.con.execute("""
+                CREATE TABLE popular_actions (
+                    name VARCHAR PRIMARY KEY,
+                    owner VARCHAR,
+                    repo VARCHAR,
+                    stars INTEGER,
+                    latest_version VARCHAR,
+                    latest_major_version VARCHAR,
+                    commit_sha VARCHAR,
+                    checked_at TIMESTAMP,
+                    action_name VARCHAR
+                );
+            """)
+        else:
+            if ("popular_actions", "commit_sha") not in existing_columns:
+                self.con.execute("ALTER TABLE popular_actions ADD COLUMN commit_sha VARCHAR")
+            if ("popular_actions", "action_name") not in existing_columns:
+                # Stored so joins against `owner/repo` action names compare a column rather than an expression
+                self.con.execute("ALTER TABLE popular_actions ADD COLUMN action_name VARCHAR")
+                self.con.execute("UPDATE popular_actions SET action_name = CONCAT(owner, '/', repo)")
 
-        self.con.execute("""
-            CREATE TABLE IF NOT EXISTS popular_repositories (
-                repo_full_name VARCHAR PRIMARY KEY,
-                clone_url VARCHAR,
-                stars INTEGER,
-                archived BOOLEAN,
-                pushed_at TIMESTAMP,
-                fork BOOLEAN,
-                size INTEGER,
-                checked_at TIMESTAMP
-            );
-        """)
-        self.con.execute("""
-            CREATE TABLE IF NOT EXISTS pull_requests (
-                repo_full_name VARCHAR,
-                pr_url VARCHAR PRIMARY KEY,
-                branch_name VARCHAR,
-                created_at TIMESTAMP,
-                status VARCHAR
-            );
-        """)
-        self.con.execute("""
-            CREATE TABLE IF NOT EXISTS pull_request_exclusions (
-                repo_full_name VARCHAR PRIMARY KEY
-            );
-        """)
+        if "action_tags" not in existing_tables:
+            self.con.execute("""
+                CREATE TABLE action_tags (
+                    action_name VARCHAR,
+                    tag VARCHAR,
+                    commit_sha VARCHAR,
+                    PRIMARY KEY (action_name, tag)
+                );
+            """)
+
+        if "action_tag_etags" not in existing_tables:
+            self.con.execute("""
+                CREATE TABLE action_tag_etags (
+                    action_name VARCHAR PRIMARY KEY,
+                    etag VARCHAR
+                );
+            """)
+
+        if "popular_repositories" not in existing_tables:
+            self.con.execute("""
+                CREATE TABLE popular_repositories (
+                    repo_full_name VARCHAR PRIMARY KEY,
+                    clone_url VARCHAR,
+                    stars INTEGER,
+                    archived BOOLEAN,
+                    pushed_at TIMESTAMP,
+                    fork BOOLEAN,
+                    size INTEGER,
+                    checked_at TIMESTAMP
+                );
+            """)
+
+        if "pull_requests" not in existing_tables:
+            self.con.execute("""
+                CREATE TABLE pull_requests (
+                    repo_full_name VARCHAR,
+                    pr_url VARCHAR PRIMARY KEY,
+                    branch_name VARCHAR,
+                    created_at TIMESTAMP,
+                    status VARCHAR
+                );
+            """)
+
+        if "pull_request_exclusions" not in existing_tables:
+            self.con.execute("""
+                CREATE TABLE pull_request_exclusions (
+                    repo_full_name VARCHAR PRIMARY KEY
+                );
+            """)
+
+        if "repo_update_locks" not in existing_tables:
+            self.con.execute("""
+                CREATE TABLE repo_update_locks (
+                    repo_full_name VARCHAR PRIMARY KEY,
+                    reason VARCHAR
+                );
+            """)
+        self._insert_or_replace_rows(
+            "repo_update_locks",
+            {"repo_full_name": "VARCHAR", "reason": "VARCHAR"},
+            ("repo_full_name",),
+            list(_REPO_UPDATE_LOCKS.items()),
+        )
+
+        if "action_exclusions" not in existing_tables:
+            self.con.execute("""
+                CREATE TABLE action_exclusions (
+                    action_name VARCHAR PRIMARY KEY,
+                    reason VARCHAR
+                );
+            """)
+        self._insert_or_replace_rows(
+            "action_exclusions",
+            {"action_name": "VARCHAR", "reason": "VARCHAR"},
+            ("action_name",),
+            list(_ACTION_EXCLUSIONS.items()),
+        )
+
+        if "repo_exclusions" not in existing_tables:
+            self.con.execute("""
+                CREATE TABLE repo_exclusions (
+                    repo_full_name VARCHAR PRIMARY KEY
+                );
+            """)
+        # Mirror `exclude_repos` from the config, which may have changed since the last run
+        self.con.execute("DELETE FROM repo_exclusions")
+        self._insert_or_replace_rows(
+            "repo_exclusions",
+            {"repo_full_name": "VARCHAR"},
+            ("repo_full_name",),
+            [(repo_full_name,) for repo_full_name in settings.exclude_repos],
+        )
 
     def save_popular_action(self, action: GitHubAction):
         """Save a popular action."""
-        self.con.execute(
-            """
-            INSERT OR REPLACE INTO popular_actions
-            (name, owner, repo, stars, latest_version, latest_major_version, commit_sha, checked_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """,
-            (
-                action.name,
-                action.owner,
-                action.repo,
-                action.stars,
-                action.latest_version,
-                action.latest_major_version,
-                action.commit_sha,
-                datetime.now(),
-            ),
+        self.save_popular_actions([action])
+
+    def save_popular_actions(self, actions: list[GitHubAction]):
+        """Save popular actions in a single bulk load, most starred first to match how they are read."""
+        if not actions:
+            return
+        checked_at = datetime.now()
+        self._insert_or_replace_rows(
+            "popular_actions",
+            {
+                "name": "VARCHAR",
+                "owner": "VARCHAR",
+                "repo": "VARCHAR",
+                "stars": "INTEGER",
+                "latest_version": "VARCHAR",
+                "latest_major_version": "VARCHAR",
+                "commit_sha": "VARCHAR",
+                "checked_at": "TIMESTAMP",
+                "action_name": "VARCHAR",
+            },
+            ("name",),
+            [
+                (
+                    action.name,
+                    action.owner,
+                    action.repo,
+                    action.stars,
+                    action.latest_version,
+                    action.latest_major_version,
+                    action.commit_sha,
+                    checked_at,
+                    f"{action.owner}/{action.repo}",
+                )
+                for action in actions
+            ],
+            order_by="stars DESC",
         )
 
     def save_popular_repo(self, repo: GitHubRepo):
         """Save a popular repos."""
+        self._insert_or_replace_rows(
+            "popular_repositories",
+            {
+                "repo_full_name": "VARCHAR",
+                "clone_url": "VARCHAR",
+                "stars": "INTEGER",
+                "archived": "BOOLEAN",
+                "pushed_at": "TIMESTAMP",
+                "fork": "BOOLEAN",
+                "size": "INTEGER",
+                "checked_at": "TIMESTAMP",
+            },
+            ("repo_full_name",),
+            [
+                (
+                    repo.repo_full_name,
+                    repo.clone_url,
+                    repo.stars,
+                    repo.archived,
+                    repo.pushed_at,
+                    repo.fork,
+                    repo.size,
+                    datetime.now(),
+                )
+            ],
+        )
+
+    def save_popular_repos_json(self, path: str) -> None:
+        """Save popular repos from a newline-delimited JSON file in one statement, without building models.
+
+        A repo repeated in the file keeps its row with the most stars.
+        """
         self.con.execute(
             """
-            INSERT OR REPLACE INTO popular_repositories VALUES (?, ?, ?, ?,?, ?, ?, ?)
+            INSERT OR REPLACE INTO popular_repositories
+            SELECT *, ? AS checked_at
+            FROM read_json(
+                ?,
+                format = 'newline_delimited',
+                columns = {
+                    repo_full_name: 'VARCHAR',
+                    clone_url: 'VARCHAR',
+                    stars: 'INTEGER',
+                    archived: 'BOOLEAN',
+                    pushed_at: 'TIMESTAMP',
+                    fork: 'BOOLEAN',
+                    size: 'INTEGER'
+                }
+            )
+            QUALIFY ROW_NUMBER() OVER (PARTITION BY repo_full_name ORDER BY stars DESC) = 1
+            ORDER BY stars DESC
         """,
-            (
-                repo.repo_full_name,
-                repo.clone_url,
-                repo.stars,
-                repo.archived,
-                repo.pushed_at,
-                repo.fork,
-                repo.size,
-                datetime.now(),
-            ),
+            (datetime.now(), path),
         )
 
     def save_pr_record(self, pr: PullRequestRecord):
         """Save a pull request record."""
-        self.con.execute(
-            """
-            INSERT OR REPLACE INTO pull_requests VALUES (?, ?, ?, ?, ?)
-        """,
-            (pr.repo_full_name, pr.pr_url, pr.branch_name, pr.created_at, pr.status),
+        self.save_pr_records([pr])
+
+    def save_pr_records(self, prs: list[PullRequestRecord]):
+        """Save pull request records in a single bulk load."""
+        if not prs:
+            return
+        self._insert_or_replace_rows(
+            "pull_requests",
+            {
+                "repo_full_name": "VARCHAR",
+                "pr_url": "VARCHAR",
+                "branch_name": "VARCHAR",
+                "created_at": "TIMESTAMP",
+                "status": "VARCHAR",
+            },
+            ("pr_url",),
+            [(pr.repo_full_name, pr.pr_url, pr.branch_name, pr.created_at, pr.status) for pr in prs],
         )
 
     def save_repo_mention(self, mention: RepositoryMention):
         """Save a repository mention."""
-        self.con.execute(
-            """
-            INSERT OR REPLACE INTO action_mentions VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """,
-            (
-                mention.repo_full_name,
-                mention.file_path,
-                mention.line_number,
-                mention.action_name,
-                mention.detected_version,
-                mention.latest_version,
-                mention.is_outdated,
-                mention.commit_sha,
-            ),
+        self._insert_or_replace_rows(
+            "action_mentions",
+            {
+                "repo_full_name": "VARCHAR",
+                "file_path": "VARCHAR",
+                "line_number": "INTEGER",
+                "action_name": "VARCHAR",
+                "detected_version": "VARCHAR",
+                "latest_version": "VARCHAR",
+                "is_outdated": "BOOLEAN",
+                "commit_sha": "VARCHAR",
+            },
+            ("repo_full_name", "file_path", "line_number"),
+            [
+                (
+                    mention.repo_full_name,
+                    mention.file_path,
+                    mention.line_number,
+                    mention.action_name,
+                    mention.detected_version,
+                    mention.latest_version,
+                    mention.is_outdated,
+                    mention.commit_sha,
+                )
+            ],
         )
 
     def save_used_actions(
         self,
     ):
-        """Save used actions."""
-        self.con.execute(f"""
+        """Save used actions, reading the per-repo JSON files with a fixed schema rather than inferring one."""
+        self.con.execute(
+            """
             CREATE OR REPLACE TABLE action_usage AS
             SELECT
                 DISTINCT *
-            FROM read_json_auto('{Path(settings.temp_dir) / "action_usage"}')
-        """)
-        num_action_usages = self.con.execute("SELECT COUNT(*) FROM action_usage").fetchall()[0][0]
+            FROM read_json(
+                ?,
+                format = 'array',
+                columns = {
+                    action_raw: 'VARCHAR',
+                    filepath: 'VARCHAR',
+                    repo_full_name: 'VARCHAR',
+                    action_name: 'VARCHAR',
+                    action_version: 'VARCHAR',
+                    line_number: 'INTEGER'
+                }
+            )
+        """,
+            (str(Path(settings.temp_dir) / "action_usage" / "**" / "*.json"),),
+        )
+        num_action_usages = self._count("SELECT COUNT(*) FROM action_usage")
         logger.info(f"Saved {num_action_usages} used actions to `action_usage`.")
 
     def save_action_tag(self, action_name: str, tag: str, commit_sha: str) -> None:
         """Save an action tag and its commit SHA."""
-        self.con.execute(
-            """
-            INSERT OR REPLACE INTO action_tags (action_name, tag, commit_sha) VALUES (?, ?, ?)
-        """,
-            (action_name, tag, commit_sha),
+        self.save_action_tags([(action_name, tag, commit_sha)])
+
+    def save_action_tags(self, action_tags: list[tuple[str, str, str]]) -> None:
+        """Save (action_name, tag, commit_sha) rows in a single bulk load."""
+        if not action_tags:
+            return
+        self._insert_or_replace_rows(
+            "action_tags",
+            {"action_name": "VARCHAR", "tag": "VARCHAR", "commit_sha": "VARCHAR"},
+            ("action_name", "tag"),
+            action_tags,
+        )
+
+    def get_action_tag_etags(self) -> dict[str, str]:
+        """Get the stored ETag of each action's tag listing, keyed by action name."""
+        return dict(self.con.execute("SELECT action_name, etag FROM action_tag_etags").fetchall())
+
+    def save_action_tag_etag(self, action_name: str, etag: str) -> None:
+        """Save the ETag of an action's tag listing."""
+        self.save_action_tag_etags([(action_name, etag)])
+
+    def save_action_tag_etags(self, etags: list[tuple[str, str]]) -> None:
+        """Save (action_name, etag) rows in a single bulk load."""
+        if not etags:
+            return
+        self._insert_or_replace_rows(
+            "action_tag_etags", {"action_name": "VARCHAR", "etag": "VARCHAR"}, ("action_name",), etags
         )
 
     def get_action_tag_sha(self, action_name: str, tag: str) -> str | None:
@@ -346,6 +638,10 @@ class Database:
         ).fetchone()
         return result[0] if result else None
 
+    def get_actions_with_tags(self) -> set[str]:
+        """Get the names of all actions that already have tags stored in the database."""
+        return {name for (name,) in self.con.execute("SELECT DISTINCT action_name FROM action_tags").fetchall()}
+
     def has_action_tags(self, action_name: str) -> bool:
         """Check if an action already has tags stored in the database."""
         result = self.con.execute(
@@ -361,3 +657,12 @@ class Database:
     def truncate_repositories(self):
         """Truncate the popular_repositories table."""
         self.con.execute("TRUNCATE TABLE popular_repositories")
+
+
+atexit.register(Database.close_all)
+
+
+@contextmanager
+def get_db(db_file: str | None = None) -> Generator[Database]:
+    """Yield a Database on the shared connection, leaving it open for reuse by later callers."""
+    yield Database(db_file)
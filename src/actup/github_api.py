@@ -1,13 +1,47 @@
 import os
 import re
+import threading
 import time
+from collections import OrderedDict
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from functools import cache
 from typing import Any
 
 import httpx
-from retry import retry
 
+from actup.backoff import retry_with_backoff
 from actup.logger import logger
 
+PAGINATION_CONCURRENCY = 8
+# Most recently used GET responses kept for conditional requests, so long runs do not hold every page in memory
+ETAG_CACHE_SIZE = 1024
+MAJOR_VERSION_PATTERN = re.compile(r"^v?(\d+)(\.\d+)*$")
+
+_OPEN_PRS_WITH_FILES_QUERY = """
+query($owner: String!, $name: String!, $cursor: String) {
+  repository(owner: $owner, name: $name) {
+    pullRequests(first: 100, states: OPEN, after: $cursor) {
+      nodes {
+        number
+        title
+        url
+        author { login }
+        files(first: 100) {
+          nodes { path }
+          pageInfo { hasNextPage }
+        }
+      }
+      pageInfo { endCursor hasNextPage }
+    }
+  }
+}
+"""
+
+
+def _is_workflow_yaml(file_name: str | None) -> bool:
+    return bool(file_name and file_name.startswith(".github/workflows/") and file_name.endswith((".yml", ".yaml")))
+
 
 class GitHubAPIClient:
     """A client for interacting with the GitHub API."""
@@ -23,20 +57,98 @@ class GitHubAPIClient:
             "X-GitHub-Api-Version": "2022-11-28",
         }
         self.client = httpx.Client(base_url="https://api.github.com", headers=self.headers, timeout=30.0)
+        # ETag and parsed body of recent GET responses, so repeat requests can be answered by a 304 that costs no
+        # rate limit. Shared by the threads that fetch pages concurrently, hence the lock
+        self._etag_cache: OrderedDict[tuple, tuple[str, Any]] = OrderedDict()
+        self._etag_cache_lock = threading.Lock()
 
+    @cache
     def _extract_major_version(self, tag: str) -> str | None:
-        match = re.match(r"^v?(\d+)(\.\d+)*$", tag)
+        match = MAJOR_VERSION_PATTERN.match(tag)
         return f"v{match[1]}" if match else None
 
-    @retry(delay=10, tries=5)
-    def _make_request(self, method: str, path: str, params: dict | None = None, json: dict | None = None) -> Any:
+    @retry_with_backoff(tries=5, delay=2)
+    def _send(
+        self,
+        method: str,
+        path: str,
+        params: dict | None = None,
+        json: dict | None = None,
+        headers: dict | None = None,
+    ) -> httpx.Response:
         logger.debug(f"Request: {method} {path}")
-        response = self.client.request(method, path, params=params, json=json)
-        response.raise_for_status()
+        response = self.client.request(method, path, params=params, json=json, headers=headers)
+        if response.status_code != 304:
+            response.raise_for_status()
+        return response
+
+    def _make_request(self, method: str, path: str, params: dict | None = None, json: dict | None = None) -> Any:
+        key = (path, frozenset((params or {}).items())) if method.upper() == "GET" else None
+        cached = None
+        if key:
+            with self._etag_cache_lock:
+                if cached := self._etag_cache.get(key):
+                    self._etag_cache.move_to_end(key)
+        headers = {"If-None-Match": cached[0]} if cached else None
+        response = self._send(method, path, params=params, json=json, headers=headers)
+        if response.status_code == 304 and cached:
+            logger.debug(f"Not modified: {method} {path}")
+            return cached[1]
+
         r = response.json()
+        if key and (etag := response.headers.get("etag")):
+            with self._etag_cache_lock:
+                self._etag_cache[key] = (etag, r)
+                self._etag_cache.move_to_end(key)
+                if len(self._etag_cache) > ETAG_CACHE_SIZE:
+                    self._etag_cache.popitem(last=False)
         logger.debug(f"{r=}")
         return r
 
+    def _graphql(self, query: str, variables: dict) -> dict:
+        """Run a GraphQL query, raising if GitHub reports errors."""
+        r = self._make_request("POST", "/graphql", json={"query": query, "variables": variables})
+        if r.get("errors"):
+            raise RuntimeError(f"GraphQL query failed: {r['errors']}")
+        return r["data"]
+
+    def _get_all_pages(self, path: str, params: dict | None = None) -> list:
+        """GET every page of a list endpoint.
+
+        The first page's `Link` header gives the last page number, so the remaining pages are fetched concurrently.
+        """
+        params = {**(params or {}), "per_page": 100}
+        first_page = self._send("GET", path, params={**params, "page": 1})
+        items = first_page.json()
+        last_url = first_page.links.get("last", {}).get("url")
+        if not last_url:
+            return items
+
+        last_page = int(httpx.URL(last_url).params["page"])
+        with ThreadPoolExecutor(max_workers=PAGINATION_CONCURRENCY) as executor:
+            for page_items in executor.map(
+                lambda page: self._make_request("GET", path, params={**params, "page": page}),
+                range(2, last_page + 1),
+            ):
+                items.extend(page_items)
+        return items
+
+    @retry_with_backoff(tries=5, delay=2)
+    def _make_conditional_request(
+        self, path: str, params: dict | None = None, etag: str | None = None
+    ) -> tuple[str | None, Any]:
+        """GET a resource, returning (etag, None) when GitHub reports it unchanged since `etag`.
+
+        Conditional requests answered with 304 do not count against the rate limit.
+        """
+        logger.debug(f"Conditional request: GET {path}")
+        headers = {"If-None-Match": etag} if etag else None
+        response = self.client.get(path, params=params, headers=headers)
+        if response.status_code == 304:
+            return etag, None
+        response.raise_for_status()
+        return response.headers.get("etag"), response.json()
+
     def create_fork(self, owner: str, repo: str) -> dict:
         """Create a fork of the repository."""
         return self._make_request("POST", f"/repos/{owner}/{repo}/forks")
@@ -46,22 +158,36 @@ class GitHubAPIClient:
         data = {"title": title, "body": body, "head": head, "base": base, "draft": True}
         return self._make_request("POST", f"/repos/{owner}/{repo}/pulls", json=data)
 
+    def _find_pr_workflow_file(self, repo_full_name: str, pr_number: int, first_page: int = 1) -> str | None:
+        """Page through a PR's changed files, stopping at the first workflow YAML file."""
+        path = f"repos/{repo_full_name}/pulls/{pr_number}/files"
+        page = first_page
+        while True:
+            pr_files = self._make_request("GET", path, params={"per_page": 100, "page": page})
+            for file in pr_files:
+                if _is_workflow_yaml(file.get("filename")):
+                    return file["filename"]
+            if len(pr_files) < 100:
+                return None
+            page += 1
+
     def find_workflow_yaml_prs(self, repo_full_name: str) -> list[dict]:
         """Identify relevant pull requests.
 
-        Only looks at PRs that modify YAML files in the .github/workflows directory.
+        Only looks at PRs that modify YAML files in the .github/workflows directory, returning each PR once with the
+        first such file found. Open PRs are listed with their changed files over GraphQL, 100 PRs per request.
         """
         modified_prs_info = []
-        params = {"state": "open", "per_page": 100}
+        owner, name = repo_full_name.split("/")
         all_prs = []
-        page = 1
+        cursor = None
         while True:
-            paged_params = {**params, "page": page}
-            response = self._make_request(method="get", path=f"repos/{repo_full_name}/pulls", params=paged_params)
-            if not response:
+            data = self._graphql(_OPEN_PRS_WITH_FILES_QUERY, {"owner": owner, "name": name, "cursor": cursor})
+            pull_requests = data["repository"]["pullRequests"]
+            all_prs.extend(pull_requests["nodes"])
+            if not pull_requests["pageInfo"]["hasNextPage"]:
                 break
-            all_prs.extend(response)
-            page += 1
+            cursor = pull_requests["pageInfo"]["endCursor"]
 
         if not all_prs:
             logger.info(f"No open pull requests found for {repo_full_name}.")
@@ -70,51 +196,47 @@ class GitHubAPIClient:
             logger.info(f"Found {len(all_prs)} open pull requests for {repo_full_name}.")
 
         for pr in all_prs:
-            pr_number = pr["number"]
-            pr_title = pr["title"]
-            pr_html_url = pr["html_url"]
-            files_params = {"per_page": 100}
-            pr_files = []
-            files_page = 1
-            while True:
-                paged_files_params = {**files_params, "page": files_page}
-                files_response = self._make_request(
-                    method="get", path=f"repos/{repo_full_name}/pulls/{pr_number}/files", params=paged_files_params
+            files = pr["files"]
+            file_modified = next(
+                (node["path"] for node in (files or {}).get("nodes", []) if _is_workflow_yaml(node["path"])), None
+            )
+            if file_modified is None and (files is None or files["pageInfo"]["hasNextPage"]):
+                # GraphQL only returns the first 100 files of a PR, so page through the rest over REST
+                file_modified = self._find_pr_workflow_file(repo_full_name, pr["number"], first_page=2 if files else 1)
+            if file_modified:
+                modified_prs_info.append(
+                    {
+                        "number": pr["number"],
+                        "title": pr["title"],
+                        "html_url": pr["url"],
+                        "file_modified": file_modified,
+                        # Deleted accounts have no author, which the REST API reports as "ghost"
+                        "author": pr["author"]["login"] if pr["author"] else "ghost",
+                    }
                 )
-                if not files_response:
-                    break
-                pr_files.extend(files_response)
-                files_page += 1
-
-            for file in pr_files:
-                file_name = file.get("filename")
-                if (
-                    file_name
-                    and file_name.startswith(".github/workflows/")
-                    and (file_name.endswith(".yml") or file_name.endswith(".yaml"))
-                ):
-                    modified_prs_info.append(
-                        {
-                            "number": pr_number,
-                            "title": pr_title,
-                            "html_url": pr_html_url,
-                            "file_modified": file_name,
-                            "author": pr["user"]["login"],
-                        }
-                    )
 
         logger.info("\n")
         logger.info(
-            f"Found {len({i['number'] for i in modified_prs_info})} open pull requests"
+            f"Found {len(modified_prs_info)} open pull requests"
             f" for {repo_full_name} that modify `.github/workflows` files."
         )
         return modified_prs_info
 
+    @cache
+    def get_branch_head(self, owner: str, repo: str, branch: str) -> str | None:
+        """Get the commit SHA at the head of a branch, or None if the branch cannot be read."""
+        try:
+            return self._make_request("GET", f"/repos/{owner}/{repo}/branches/{branch}")["commit"]["sha"]
+        except Exception:
+            return None
+
+    @cache
     def get_current_user(self) -> str:
         """Get the authenticated user's login."""
         user = self._make_request("GET", "/user")
         return user["login"]
 
+    @cache
     def get_repo(self, owner: str, repo: str) -> dict:
         """Get repository information."""
         return self._make_request("GET", f"/repos/{owner}/{repo}")
@@ -123,29 +245,40 @@ class GitHubAPIClient:
         """Get pull request details."""
         return self._make_request("GET", f"/repos/{owner}/{repo}/pulls/{number}")
 
-    def search_popular_repositories(self, limit) -> list[dict]:
-        """Search for popular repositories."""
-        repos = []
+    def list_user_repos(self, user: str) -> list[dict]:
+        """Get all repositories owned by a user, including forks."""
+        return self._get_all_pages(f"/users/{user}/repos", params={"type": "owner"})
+
+    def iter_popular_repositories(self, limit) -> Iterator[dict]:
+        """Search for popular repositories, yielding each one as its page arrives.
+
+        Pages are fetched one at a time, as the search API's rate limit is too low to benefit from concurrency.
+        """
+        count = 0
         max_stars_count = 1_000_000_000
-        while len(repos) < limit:
+        while count < limit:
             page = 1
             while True:
                 params = {"q": f"stars:1..{max_stars_count} sort:stars", "page": page, "per_page": 100}
                 data = self._make_request("GET", "/search/repositories", params=params)
-                if not data.get("items", []):
+                items = data.get("items", [])[: limit - count]
+                if not items:
                     break
-                repos.extend(data.get("items", []))
-                if len(repos) > limit:
+                yield from items
+                count += len(items)
+                if count >= limit:
                     break
                 page += 1
                 if page == 11:  # Not sure why page 10 is getting 403 codes, but it is
-                    max_stars_count = int(repos[-1]["stargazers_count"])
-                    logger.info(f"Retrieved {len(repos)} repositories...")
+                    max_stars_count = int(items[-1]["stargazers_count"])
+                    logger.info(f"Retrieved {count} repositories...")
                     logger.info(f"Resetting max_stars_count to {max_stars_count}.")
                     time.sleep(60)  # To avoid GitHub returning 403 codes
                     break
 
-        return repos[:limit]
+    def repo_exists(self, owner: str, repo: str) -> bool:
+        """Check whether a repository is visible yet, without retrying or caching the answer."""
+        return self.client.get(f"/repos/{owner}/{repo}").status_code == 200
 
     def sync_fork(self, owner: str, repo: str, branch: str) -> dict:
         """Sync a fork with the upstream repository."""
@@ -163,18 +296,40 @@ class GitHubAPIClient:
             List of tag objects with name and commit SHA.
 
         """
-        tags = []
-        page = 1
+        _, tags = self.get_tags_if_modified(owner, repo)
+        return tags or []
+
+    def get_tags_if_modified(
+        self, owner: str, repo: str, etag: str | None = None
+    ) -> tuple[str | None, list[dict] | None]:
+        """Get all tags for a repository unless they are unchanged since `etag`.
+
+        Args:
+            owner: The owner of the repository.
+            repo: The name of the repository.
+            etag: The ETag of the first page of tags from a previous call, if any.
+
+        Returns:
+            A tuple of (ETag of the first page, list of tag objects), with None in place of the tags
+            when GitHub reports them unchanged.
+
+        """
+        path = f"/repos/{owner}/{repo}/tags"
+        etag, tags = self._make_conditional_request(path, params={"per_page": 100, "page": 1}, etag=etag)
+        if tags is None or len(tags) < 100:
+            return etag, tags
+
+        page = 2
         while True:
             params = {"per_page": 100, "page": page}
-            response = self._make_request("GET", f"/repos/{owner}/{repo}/tags", params=params)
+            response = self._make_request("GET", path, params=params)
             if not response:
                 break
             tags.extend(response)
             page += 1
             if len(response) < 100:
                 break
-        return tags
+        return etag, tags
 
     def get_tag_sha(self, owner: str, repo: str, tag: str) -> str | None:
         """Resolve a tag to its commit SHA.
@@ -1,12 +1,27 @@
+import asyncio
+import hashlib
+import json
 import os
-from multiprocessing import Pool, cpu_count
+import tempfile
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Any
 
 import requests
-from retry import retry
-from tqdm import tqdm
+from requests.adapters import HTTPAdapter
+from tqdm.asyncio import tqdm_asyncio
+from urllib3.util import Retry
 
+from actup.config import settings
 from actup.logger import logger
 
+# Upper bound on in-flight marketplace requests, as GitHub blocks clients that send too many at once
+MARKETPLACE_CONCURRENCY = 16
+# Stars and latest releases change slowly, so re-runs within this many seconds reuse saved responses
+MARKETPLACE_CACHE_TTL = 3600
+
 
 class GitHubPublicClient:
     """A client for interacting with GitHub public APIs.
@@ -19,6 +34,17 @@ class GitHubPublicClient:
     ):
         """Initialize the GitHubClient."""
         self.session = requests.session()
+        # One pooled keep-alive connection per worker thread, instead of urllib3's default of 10 per host.
+        # Throttled and failed requests are retried on that connection, honouring any `Retry-After` header.
+        retries = Retry(
+            total=5,
+            backoff_factor=1.0,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods={"GET"},
+            respect_retry_after_header=True,
+        )
+        adapter = HTTPAdapter(pool_maxsize=MARKETPLACE_CONCURRENCY, max_retries=retries)
+        self.session.mount("https://", adapter)
         self.token = os.environ.get("PAT_GITHUB")
         self.headers = {
             "Authorization": f"Bearer {self.token}",
@@ -26,46 +52,101 @@ class GitHubPublicClient:
             "X-GitHub-Api-Version": "2022-11-28",
         }
 
-    @retry(delay=10, tries=3)
-    def _call_url(self, headers: dict[str, str], url: str) -> dict[str, str]:
-        r = self.session.get(headers=headers, url=url)
-        return r.json()
+    def _fetch_url(self, headers: dict[str, str], url: str) -> bytes:
+        r = self.session.get(headers=headers, url=url, timeout=(5, 30))
+        # Failed lookups can still come back as a JSON `error` payload, so only non-JSON pages count as HTTP errors
+        if not r.headers.get("content-type", "").startswith("application/json"):
+            r.raise_for_status()
+        return r.content
+
+    @staticmethod
+    def _cache_dir() -> Path:
+        return Path(settings.temp_dir) / "marketplace_cache"
+
+    def _prune_cache(self) -> None:
+        """Delete saved responses older than `MARKETPLACE_CACHE_TTL`, so the cache does not grow without bound."""
+        cutoff = time.time() - MARKETPLACE_CACHE_TTL
+        try:
+            entries = list(os.scandir(self._cache_dir()))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.unlink(entry.path)
+            except FileNotFoundError:
+                pass
+
+    def _call_url(self, headers: dict[str, str], url: str) -> dict[str, Any]:
+        """Fetch a marketplace URL, reusing a response saved to disk within the last `MARKETPLACE_CACHE_TTL` seconds."""
+        cache_file = self._cache_dir() / f"{hashlib.sha256(url.encode()).hexdigest()}.json"
+        try:
+            if time.time() - cache_file.stat().st_mtime < MARKETPLACE_CACHE_TTL:
+                return json.loads(cache_file.read_bytes())
+        except FileNotFoundError:
+            pass
+        except ValueError:
+            logger.debug(f"Ignoring unreadable cached response for {url}")
+
+        content = self._fetch_url(headers, url)
+        data = json.loads(content)
+        if "error" not in data:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            # Written aside and renamed into place, so an interrupted write never leaves a torn cache file
+            fd, tmp_path = tempfile.mkstemp(dir=cache_file.parent, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(content)
+                os.replace(tmp_path, cache_file)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        return data
+
+    async def _call_url_async(self, executor: Executor, headers: dict[str, str], url: str) -> dict[str, Any]:
+        return await asyncio.get_running_loop().run_in_executor(executor, partial(self._call_url, headers, url))
+
+    async def _fetch_action(self, executor: Executor, result: dict[str, Any]) -> dict | None:
+        """Fetch the details of a marketplace listing, keeping only the fields that are used."""
+        action_data = await self._call_url_async(
+            executor, headers=self.headers, url=f"https://github.com/marketplace/actions/{result['slug']}"
+        )
+        if "error" in action_data:
+            logger.warning(f"Unable to fetch info for {result}.")
+            return None
+        return {
+            "name": result["name"],
+            "owner": action_data["payload"]["repository"]["owner"],
+            "repo": action_data["payload"]["repository"]["name"],
+            "stars": action_data["payload"]["action"]["stars"],
+            "latest_version": action_data["payload"]["releaseData"]["latestRelease"]["tagName"],
+        }
 
-    def _search_popular_actions(self, page_num) -> list[dict]:
-        actions = []
+    async def _search_popular_actions(self, executor: Executor, page_num: int) -> list[dict]:
         url = f"https://github.com/marketplace?page={page_num}&type=actions"
         logger.debug(f"Fetching from {url}")
-        marketplace_data = self._call_url(headers={"accept": "application/json"}, url=url)
-        for i in marketplace_data["results"]:
-            action_data = self._call_url(
-                headers=self.headers, url=f"https://github.com/marketplace/actions/{i['slug']}"
+        marketplace_data = await self._call_url_async(executor, headers={"accept": "application/json"}, url=url)
+        # The detail pages of a listing are independent, so they are fetched together rather than one by one
+        actions = await asyncio.gather(*(self._fetch_action(executor, i) for i in marketplace_data["results"]))
+        return [action for action in actions if action]
+
+    async def _search_all_popular_actions(self, page_numbers: list[int]) -> list[list[dict]]:
+        # The pool size bounds how many requests are in flight across all pages
+        with ThreadPoolExecutor(max_workers=MARKETPLACE_CONCURRENCY) as executor:
+            return await tqdm_asyncio.gather(
+                *(self._search_popular_actions(executor, page_num) for page_num in page_numbers),
+                total=len(page_numbers),
+                desc="Finding Actions",
             )
-            if "error" in action_data:
-                logger.warning(f"Unable to fetch info for {i}.")
-            else:
-                actions.append(
-                    {
-                        "name": i["name"],
-                        "owner": action_data["payload"]["repository"]["owner"],
-                        "repo": action_data["payload"]["repository"]["name"],
-                        "stars": action_data["payload"]["action"]["stars"],
-                        "latest_version": action_data["payload"]["releaseData"]["latestRelease"]["tagName"],
-                    }
-                )
-
-        return actions
 
     def search_popular_actions(self, limit) -> list[dict]:
-        """Search for popular GitHub Actions."""
-        actions = []
-        page_numbers = [item for item in list(range(1, int(limit / 20) + 2)) if item <= 500]
+        """Search for popular GitHub Actions.
 
-        with Pool(processes=min(4, cpu_count())) as pool:  # Unable to max out as requests will be blocked
-            for result in tqdm(
-                pool.imap_unordered(self._search_popular_actions, page_numbers),
-                total=len(page_numbers),
-                desc="Finding Actions",
-            ):
-                actions.extend(result)
+        Requests are I/O-bound, so they run on threads driven from an event loop rather than in worker processes.
+        """
+        self._prune_cache()
+        page_numbers = [item for item in list(range(1, int(limit / 20) + 2)) if item <= 500]
+        pages = asyncio.run(self._search_all_popular_actions(page_numbers))
+        actions = [action for page in pages for action in page]
 
         return actions[:limit]
@@ -4,9 +4,16 @@ from rich.logging import RichHandler
 
 
 def setup_logging(level: int = logging.INFO) -> logging.Logger:
-    """Set up the application logger."""
-    logging.basicConfig(level=level, format="%(message)s", datefmt="[%X]", handlers=[RichHandler(rich_tracebacks=True)])
-    return logging.getLogger("actup")
+    """Set up the application logger, installing its handler only once."""
+    logger = logging.getLogger("actup")
+    if not logger.handlers:
+        handler = RichHandler(rich_tracebacks=True)
+        handler.setFormatter(logging.Formatter("%(message)s", datefmt="[%X]"))
+        logger.addHandler(handler)
+        logger.setLevel(level)
+        # Records stop here, so third-party INFO logs (e.g. a line per httpx request) are not rendered as well
+        logger.propagate = False
+    return logger
 
 
 logger = setup_logging()
@@ -1,11 +1,13 @@
 from datetime import datetime
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 
 class GitHubAction(BaseModel):
     """Model representing a GitHub Action."""
 
+    model_config = ConfigDict(frozen=True)
+
     name: str
     owner: str
     repo: str
@@ -19,6 +21,8 @@ class GitHubAction(BaseModel):
 class GitHubRepo(BaseModel):
     """Model representing a GitHub Repository."""
 
+    model_config = ConfigDict(frozen=True)
+
     repo_full_name: str
     clone_url: str
     stars: int
@@ -29,21 +33,11 @@ class GitHubRepo(BaseModel):
     checked_at: datetime | None = None
 
 
-class GitHubUsedAction(BaseModel):
-    """Model representing a used GitHub Action."""
-
-    action_raw: str
-    file_path: str
-    repo_full_name: str
-    action_name: str
-    action_version: str
-    line_number: int
-    checked_at: datetime | None = None
-
-
 class RepositoryMention(BaseModel):
     """Model representing an action mention in a repository."""
 
+    model_config = ConfigDict(frozen=True)
+
     repo_full_name: str
     file_path: str
     line_number: int
@@ -58,6 +52,8 @@ class RepositoryMention(BaseModel):
 class PullRequestRecord(BaseModel):
     """Model representing a pull request record."""
 
+    model_config = ConfigDict(frozen=True)
+
     repo_full_name: str
     pr_url: str
     branch_name: str
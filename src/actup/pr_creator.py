@@ -1,6 +1,10 @@
+import os
 import shutil
+import threading
 import time
 import webbrowser
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from enum import Enum
 from pathlib import Path
@@ -8,7 +12,7 @@ from pathlib import Path
 from git import Repo
 
 from actup.config import settings
-from actup.database import Database
+from actup.database import get_db
 from actup.github_api import GitHubAPIClient
 from actup.logger import logger
 from actup.models import PullRequestRecord, RepositoryMention
@@ -16,9 +20,21 @@ from actup.tracker import update_tracker
 from actup.utils import (
     git_clone_shallow,
     merge_pr_body_into_template,
-    replace_action_version_in_content,
+    replace_action_references_in_content,
 )
 
+FORK_POLL_DELAYS = (0.5, 1, 2, 4)
+PR_CONCURRENCY = 8
+
+# Title fragments of existing PRs that already bump action versions. "bump " also covers prefixed titles such as
+# "ci: bump " or "chore(deps): bump ", and Dependabot's "Bump the github-actions group"
+BUMP_TITLE_NEEDLES = ("bump ", "chore(deps): update ")
+
+
+def _repo_relative_path(file_path: str) -> str:
+    """Strip the `<temp_dir>/cloned_repos/<owner_repo>/` prefix from the path of a scanned workflow file."""
+    return file_path.removeprefix(f"{Path(settings.temp_dir) / 'cloned_repos'}/").split("/", 1)[1]
+
 
 class UpdateMode(str, Enum):
     """Mode for updating GitHub Actions in PRs."""
@@ -47,10 +63,29 @@ class PullRequestCreator:
         self.client = client or GitHubAPIClient()
         self.temp_dir = Path(temp_dir or settings.temp_dir) / "pr"
         self.current_user = None
+        self.existing_forks: set[str] | None = None
         self.pin_to_sha = pin_to_sha
         self.mode = UpdateMode.PIN_TO_SHA if pin_to_sha else UpdateMode.LATEST_VERSION
+        # Serialises database and tracker writes when repos are processed on several threads
+        self._record_lock = threading.Lock()
+
+    def _load_fork_state(self) -> tuple[str, set[str]]:
+        """Look up the authenticated user and their existing forks, once per instance."""
+        if self.current_user is None:
+            self.current_user = self.client.get_current_user()
+        if self.existing_forks is None:
+            self.existing_forks = {r["name"] for r in self.client.list_user_repos(self.current_user) if r.get("fork")}
+        return self.current_user, self.existing_forks
+
+    def _is_fork_of(self, current_user: str, owner: str, repo_name: str) -> bool:
+        """Check that the user's repository of this name is a fork of `owner/repo_name`, not an unrelated repo."""
+        try:
+            parent = self.client.get_repo(current_user, repo_name).get("parent") or {}
+        except Exception:
+            return False
+        return parent.get("full_name", "").lower() == f"{owner}/{repo_name}".lower()
 
-    def prepare_fork(self, owner: str, repo_name: str) -> str:
+    def prepare_fork(self, owner: str, repo_name: str) -> str | None:
         """Fork and sync the repository.
 
         Args:
@@ -58,33 +93,63 @@ class PullRequestCreator:
             repo_name: The name of the repository.
 
         Returns:
-            The username of the authenticated user (fork owner).
+            The username of the authenticated user (fork owner), or None if no fork of the repository is available.
 
         """
-        if self.current_user is None:
-            self.current_user = self.client.get_current_user()
+        current_user, existing_forks = self._load_fork_state()
 
         target_repo_info = self.client.get_repo(owner, repo_name)
         default_branch = target_repo_info.get("default_branch", "main")
 
-        logger.info("Forking...")
-        try:
-            self.client.create_fork(owner, repo_name)
-            time.sleep(5)
-        except Exception:
-            logger.info("Fork already exists (or failed), proceeding...")
+        created_fork = False
+        if repo_name in existing_forks:
+            logger.info("Fork already exists, proceeding...")
+        else:
+            logger.info("Forking...")
+            try:
+                self.client.create_fork(owner, repo_name)
+                existing_forks.add(repo_name)
+                created_fork = True
+                # Forks are created asynchronously, so wait only until this one is visible
+                for delay in FORK_POLL_DELAYS:
+                    if self.client.repo_exists(current_user, repo_name):
+                        break
+                    time.sleep(delay)
+                else:
+                    # The last sleep still needs a check of its own
+                    if not self.client.repo_exists(current_user, repo_name):
+                        logger.warning(f"Fork {current_user}/{repo_name} is not visible yet, skipping.")
+                        return None
+            except Exception:
+                logger.info("Fork already exists (or failed), proceeding...")
+
+        # Branches are pushed to `current_user/repo_name`, which must not be an unrelated repo of the same name
+        if not self._is_fork_of(current_user, owner, repo_name):
+            logger.warning(f"{current_user}/{repo_name} is not a fork of {owner}/{repo_name}, skipping.")
+            return None
+
+        if created_fork:
+            # A fresh fork already matches upstream
+            return current_user
+
+        upstream_sha = self.client.get_branch_head(owner, repo_name, default_branch)
+        if upstream_sha and upstream_sha == self.client.get_branch_head(current_user, repo_name, default_branch):
+            logger.info("Fork already up to date with upstream.")
+            return current_user
 
         try:
-            self.client.sync_fork(self.current_user, repo_name, default_branch)
+            self.client.sync_fork(current_user, repo_name, default_branch)
             logger.info("Fork synced with upstream.")
         except Exception as e:
             logger.warning(f"Could not sync fork: {e}")
 
-        return self.current_user
+        return current_user
 
     def clone_repository(self, owner: str, repo_name: str, current_user: str) -> tuple[Repo, Path]:
         """Clone the forked repository.
 
+        A clone left behind by an interrupted run is refreshed in place rather than cloned again.
+
         Args:
             owner: The owner of the original repository.
             repo_name: The name of the repository.
@@ -98,12 +163,21 @@ class PullRequestCreator:
         repo_full_name = f"{owner}/{repo_name}"
         repo_dir = self.temp_dir / repo_full_name.replace("/", "_")
 
-        if repo_dir.exists():
-            shutil.rmtree(repo_dir)
+        if (repo_dir / ".git").exists():
+            try:
+                repo = Repo(repo_dir)
+                logger.info(f"Refreshing existing clone of {fork_url}...")
+                repo.git.fetch("--depth=1", "origin", "HEAD")
+                repo.git.reset("--hard", "FETCH_HEAD")
+                repo.git.clean("-fdx")
+                return repo, repo_dir
+            except Exception as e:
+                logger.warning(f"Could not reuse existing clone, cloning again: {e}")
 
         logger.info(f"Cloning fork {fork_url}...")
         auth_url = fork_url.replace("https://", f"https://{self.client.token}@")
-        repo = git_clone_shallow(auth_url, str(repo_dir))
+        git_clone_shallow(auth_url, str(repo_dir))
+        repo = Repo(repo_dir)
 
         return repo, repo_dir
 
@@ -119,10 +193,13 @@ class PullRequestCreator:
 
         """
         branch_name = f"{prefix}-{int(datetime.now().timestamp())}"
-        repo.git.checkout("-b", branch_name)
+        # The new branch starts at HEAD, so pointing HEAD at it is equivalent to `git checkout -b` without a subprocess
+        repo.head.reference = repo.create_head(branch_name)
         return branch_name
 
-    def update_workflow_files(self, mentions: list[RepositoryMention], repo_dir: Path) -> set[str]:
+    def update_workflow_files(
+        self, mentions: list[RepositoryMention], repo_dir: Path
+    ) -> tuple[set[str], list[RepositoryMention]]:
         """Update workflow files with new action versions.
 
         Args:
@@ -130,57 +207,64 @@ class PullRequestCreator:
             repo_dir: Path to the cloned repository.
 
         Returns:
-            Set of modified file paths.
+            A tuple of (set of modified file paths relative to the repository root, mentions that were updated).
 
         """
-        modified_files = set()
+        mentions_by_file = defaultdict(list)
         for m in mentions:
-            m.file_path = m.file_path.replace("/cloned_repos/", "/pr/")
-            full_path = m.file_path
-            with open(full_path, "r") as f:
-                content = f.read()
+            mentions_by_file[_repo_relative_path(m.file_path)].append(m)
 
-            if self.pin_to_sha:
-                if m.commit_sha:
-                    new_content = self._replace_with_sha_comment(
-                        content, m.action_name, m.detected_version, m.commit_sha
-                    )
-                else:
-                    logger.info(f"Skipping {m.action_name}@{m.detected_version} - no commit SHA found in database")
-                    continue
-            elif m.latest_version:
-                new_content = replace_action_version_in_content(
-                    content, m.action_name, m.detected_version, m.latest_version
-                )
-            else:
+        modified_files = set()
+        updated_mentions = []
+        for file_path, file_mentions in mentions_by_file.items():
+            replacements = {}
+            for m in file_mentions:
+                old_ref = f"{m.action_name}@{m.detected_version}"
+                if self.pin_to_sha:
+                    if m.commit_sha:
+                        replacements[old_ref] = f"{m.action_name}@{m.commit_sha} #{m.detected_version}"
+                    else:
+                        logger.info(f"Skipping {m.action_name}@{m.detected_version} - no commit SHA found in database")
+                elif m.latest_version:
+                    replacements[old_ref] = f"{m.action_name}@{m.latest_version}"
+
+            if not replacements:
                 continue
 
+            path = repo_dir / file_path
+            content = path.read_bytes()
+            new_content, replaced = replace_action_references_in_content(content, replacements)
             if new_content != content:
-                with open(full_path, "w") as f:
-                    f.write(new_content)
-                modified_files.add(m.file_path)
+                path.write_bytes(new_content)
+                modified_files.add(file_path)
+                # Only mentions whose reference was found in the file go into the PR description
+                updated_mentions.extend(m for m in file_mentions if f"{m.action_name}@{m.detected_version}" in replaced)
 
-        return modified_files
+        return modified_files, updated_mentions
 
-    def _replace_with_sha_comment(self, content: str, action_name: str, old_version: str, commit_sha: str) -> str:
-        """Replace version with commit SHA and add a comment with the original version.
+    def has_outdated_references(self, mentions: list[RepositoryMention], repo_dir: Path) -> bool:
+        """Check whether any outdated `<action>@<version>` reference is still present in its workflow file.
 
         Args:
-            content: The file content.
-            action_name: The action name (e.g., 'actions/checkout').
-            old_version: The old version tag (e.g., 'v4.0.1').
-            commit_sha: The commit SHA to pin to.
+            mentions: List of RepositoryMention objects representing outdated actions.
+            repo_dir: Path to the cloned repository.
 
         Returns:
-            The updated content with SHA pinning and comment.
+            True if at least one reference is still in the files, False if all of them are gone.
 
         """
-        old_ref = f"uses: {action_name}@{old_version}"
-        new_ref = f"uses: {action_name}@{commit_sha} #{old_version}"
+        references_by_file = defaultdict(set)
+        for m in mentions:
+            references_by_file[_repo_relative_path(m.file_path)].add(f"{m.action_name}@{m.detected_version}".encode())
 
-        if old_ref in content:
-            return content.replace(old_ref, new_ref)
-        return content
+        for file_path, references in references_by_file.items():
+            try:
+                content = (repo_dir / file_path).read_bytes()
+            except OSError:
+                continue
+            if any(reference in content for reference in references):
+                return True
+        return False
 
     def commit_and_push(self, repo: Repo, branch_name: str, modified_files: list[str]) -> None:
         """Commit and push changes to the remote repository.
@@ -188,10 +272,10 @@ class PullRequestCreator:
         Args:
             repo: The Git repository object.
             branch_name: The name of the branch to push.
-            modified_files: List of modified file paths to commit.
+            modified_files: List of modified file paths to commit, relative to the repository root.
 
         """
-        repo.index.add(["/".join(m.split("/")[3:]) for m in modified_files])
+        repo.index.add(modified_files)
         if self.pin_to_sha:
             commit_message = "chore: Pin GitHub Actions to commit SHAs"
         else:
@@ -229,10 +313,9 @@ class PullRequestCreator:
             title_lower = pr["title"].strip().lower()
             if self.pin_to_sha:
                 if (
-                    (title_lower.find("pin") >= 0 and title_lower.find("sha") >= 0)
-                    or title_lower.find("commit sha") >= 0
-                    or (title_lower.find("pin") >= 0 and title_lower.find("hash") >= 0)
-                    or title_lower.find("pin to exact") >= 0
+                    ("pin" in title_lower and ("sha" in title_lower or "hash" in title_lower))
+                    or "commit sha" in title_lower
+                    or "pin to exact" in title_lower
                     or pr.get("author") == "pgoslatara"
                 ):
                     logger.info(
@@ -241,16 +324,7 @@ class PullRequestCreator:
                     )
                     return False
             else:
-                if (
-                    title_lower.find("(deps): bump actions/") >= 0
-                    or title_lower.find("build: bump ") >= 0
-                    or title_lower.find("bump ") >= 0
-                    or title_lower.find("bump the github-actions group") == 0
-                    or title_lower.find("chore(deps): bump ") >= 0
-                    or title_lower.find("chore(deps): update ") >= 0
-                    or title_lower.find("ci: bump ") >= 0
-                    or pr.get("author") == "pgoslatara"
-                ):
+                if any(needle in title_lower for needle in BUMP_TITLE_NEEDLES) or pr.get("author") == "pgoslatara":
                     logger.info(
                         f"PR {pr['number']} already updates GitHub Actions or is created by me so not creating any PR."
                     )
@@ -292,7 +366,7 @@ Learn more: https://docs.github.com/en/actions/security-guides/security-hardenin
                     sha_short = m.commit_sha[:7]
                     pr_body += (
                         f"- Pinned `{m.action_name}` from `{m.detected_version}` to `{sha_short}` "
-                        f"in `{'/'.join(m.file_path.split('/')[3:])}`\n"
+                        f"in `{_repo_relative_path(m.file_path)}`\n"
                     )
         else:
             if len(mentions) > 1:
@@ -304,7 +378,7 @@ Learn more: https://docs.github.com/en/actions/security-guides/security-hardenin
             for m in mentions:
                 pr_body += (
                     f"- Updated `{m.action_name}` from `{m.detected_version}` to "
-                    f"`{m.latest_version}` in `{'/'.join(m.file_path.split('/')[3:])}`\n"
+                    f"`{m.latest_version}` in `{_repo_relative_path(m.file_path)}`\n"
                 )
 
         return pr_title, pr_body
@@ -323,10 +397,12 @@ Learn more: https://docs.github.com/en/actions/security-guides/security-hardenin
         if not dot_github_dir.exists():
             return None
 
-        for f in dot_github_dir.iterdir():
-            if f.is_file() and f.name.lower() == "pull_request_template.md":
-                with open(f, "r") as fp:
-                    return fp.read()
+        # Directory entries carry their name and type, so only the matching entry needs checking
+        with os.scandir(dot_github_dir) as entries:
+            for entry in entries:
+                if entry.name.lower() == "pull_request_template.md" and entry.is_file():
+                    with open(entry.path, "r") as fp:
+                        return fp.read()
 
         return None
 
@@ -378,7 +454,7 @@ Learn more: https://docs.github.com/en/actions/security-guides/security-hardenin
             base=base,
         )
 
-    def record_pr(self, repo_full_name: str, pr_url: str, branch_name: str, pr_state: str) -> None:
+    def record_pr(self, repo_full_name: str, pr_url: str, branch_name: str, pr_state: str) -> PullRequestRecord:
         """Record the created PR in the database and tracker.
 
         Args:
@@ -387,6 +463,9 @@ Learn more: https://docs.github.com/en/actions/security-guides/security-hardenin
             branch_name: The branch name used for the PR.
             pr_state: The state of the PR (e.g., 'open').
 
+        Returns:
+            The recorded PullRequestRecord.
+
         """
         record = PullRequestRecord(
             repo_full_name=repo_full_name,
@@ -395,11 +474,12 @@ Learn more: https://docs.github.com/en/actions/security-guides/security-hardenin
             created_at=datetime.now(),
             status=pr_state,
         )
-        db = Database()
-        db.save_pr_record(record)
-        db.add_repo_to_pr_exclusions(repo_full_name)
-        db.close()
-        update_tracker(record)
+        with self._record_lock:
+            with get_db() as db, db.transaction():
+                db.save_pr_record(record)
+                db.add_repo_to_pr_exclusions(repo_full_name)
+            update_tracker(record)
+        return record
 
     def mark_repo_excluded(self, repo_full_name: str) -> None:
         """Mark a repository as excluded from PR creation.
@@ -408,9 +488,8 @@ Learn more: https://docs.github.com/en/actions/security-guides/security-hardenin
             repo_full_name: The full name of the repository.
 
         """
-        db = Database()
-        db.add_repo_to_pr_exclusions(repo_full_name)
-        db.close()
+        with self._record_lock, get_db() as db:
+            db.add_repo_to_pr_exclusions(repo_full_name)
 
     def create_pr_for_repo(
         self,
@@ -443,6 +522,8 @@ Learn more: https://docs.github.com/en/actions/security-guides/security-hardenin
             logger.info(f"Processing updates for {repo_full_name}...")
 
             current_user = self.prepare_fork(owner, repo_name)
+            if current_user is None:
+                return None
             repo, repo_dir = self.clone_repository(owner, repo_name, current_user)
 
             target_repo_info = self.client.get_repo(owner, repo_name)
@@ -453,17 +534,21 @@ Learn more: https://docs.github.com/en/actions/security-guides/security-hardenin
             else:
                 branch_name = self.create_branch(repo)
 
-            modified_files = self.update_workflow_files(mentions, repo_dir)
+            modified_files, updated_mentions = self.update_workflow_files(mentions, repo_dir)
 
             if not modified_files:
-                logger.info("No files changed.")
-                self.mark_repo_excluded(repo_full_name)
+                if self.has_outdated_references(mentions, repo_dir):
+                    # Leave the repo eligible, as excluding it would silently drop updates the rewrite missed
+                    logger.warning(f"Could not rewrite the outdated actions found in {repo_full_name}, skipping.")
+                else:
+                    logger.info("No files changed.")
+                    self.mark_repo_excluded(repo_full_name)
                 shutil.rmtree(repo_dir)
                 return None
 
             self.commit_and_push(repo, branch_name, list(modified_files))
 
-            pr_title, pr_body = self.build_pr_details(mentions, modified_files)
+            pr_title, pr_body = self.build_pr_details(updated_mentions, modified_files)
 
             wip_pr_url = (
                 f"https://github.com/{repo_full_name}/compare/{default_branch}...{current_user}:"
@@ -511,16 +596,10 @@ Learn more: https://docs.github.com/en/actions/security-guides/security-hardenin
             logger.info("\n")
             webbrowser.open(pr["html_url"])
 
-            self.record_pr(repo_full_name, pr["html_url"], branch_name, pr["state"])
+            record = self.record_pr(repo_full_name, pr["html_url"], branch_name, pr["state"])
             shutil.rmtree(repo_dir)
 
-            return PullRequestRecord(
-                repo_full_name=repo_full_name,
-                pr_url=pr["html_url"],
-                branch_name=branch_name,
-                created_at=datetime.now(),
-                status=pr["state"],
-            )
+            return record
         finally:
             if pin_to_sha is not None:
                 self.pin_to_sha = old_pin_to_sha
@@ -528,15 +607,16 @@ Learn more: https://docs.github.com/en/actions/security-guides/security-hardenin
 
     def create_prs(
         self,
-        mentions: list[RepositoryMention],
+        repo_mentions: dict[str, list[RepositoryMention]],
         interactive: bool = True,
         pin_to_sha: bool | None = None,
     ) -> list[PullRequestRecord]:
         """Create PRs for all outdated actions grouped by repository.
 
         Args:
-            mentions: List of all RepositoryMention objects.
-            interactive: Whether to prompt for confirmation before creating each PR.
+            repo_mentions: RepositoryMention objects keyed by repository full name.
+            interactive: Whether to prompt for confirmation before creating each PR. Repos are processed
+                concurrently when False.
             pin_to_sha: Whether to pin actions to commit SHAs instead of version tags.
 
         Returns:
@@ -547,16 +627,17 @@ Learn more: https://docs.github.com/en/actions/security-guides/security-hardenin
             self.pin_to_sha = pin_to_sha
             self.mode = UpdateMode.PIN_TO_SHA if pin_to_sha else UpdateMode.LATEST_VERSION
 
-        from collections import defaultdict
-
-        repo_updates = defaultdict(list)
-        for mention in mentions:
-            repo_updates[mention.repo_full_name].append(mention)
-
-        results = []
-        for repo_full_name, repo_mentions in repo_updates.items():
-            result = self.create_pr_for_repo(repo_full_name, repo_mentions, interactive)
-            if result:
-                results.append(result)
+        if interactive:
+            results = [
+                self.create_pr_for_repo(repo_full_name, mentions, interactive)
+                for repo_full_name, mentions in repo_mentions.items()
+            ]
+        else:
+            # Each repo mostly waits on GitHub and git, so unattended runs process several at once
+            self._load_fork_state()
+            with ThreadPoolExecutor(max_workers=PR_CONCURRENCY) as executor:
+                results = list(
+                    executor.map(lambda item: self.create_pr_for_repo(*item, interactive=False), repo_mentions.items())
+                )
 
-        return results
+        return [result for result in results if result]
@@ -1,4 +1,5 @@
 import re
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import TYPE_CHECKING
 
@@ -9,74 +10,87 @@ if TYPE_CHECKING:
     from actup.github_api import GitHubAPIClient
 
 TRACKER_FILE = "PR_TRACKER.md"
+STATUS_CONCURRENCY = 16
+
+# Finds a PR link, [url](url), specifically to https://github.com/owner/repo/pull/number
+PR_LINK_PATTERN = re.compile(r"\[.*?\]\((https://github\.com/([^/]+)/([^/]+)/pull/(\d+))\)")
 
 
 def update_tracker(pr: PullRequestRecord):
     """Update the pull request tracker file."""
-    path = Path(TRACKER_FILE)
-    if not path.exists():
-        with open(path, "w") as f:
+    update_tracker_batch([pr])
+
+
+def update_tracker_batch(prs: list[PullRequestRecord]):
+    """Append several pull requests to the tracker file in one write."""
+    # A single append-mode open creates the file if needed, and an empty file is the cue to write the header
+    with open(TRACKER_FILE, "a") as f:
+        if f.tell() == 0:
             f.write("# Pull Request Tracker\n\n| Date | Repo | PR | Status |\n|---|---|---|---|\n")
+        f.writelines(
+            f"| {pr.created_at:%Y-%m-%d} | {pr.repo_full_name} | [{pr.pr_url}]({pr.pr_url}) | {pr.status} |\n"
+            for pr in prs
+        )
 
-    with open(path, "a") as f:
-        date_str = pr.created_at.strftime("%Y-%m-%d")
-        f.write(f"| {date_str} | {pr.repo_full_name} | [{pr.pr_url}]({pr.pr_url}) | {pr.status} |\n")
+
+def _fetch_pr_status(client: "GitHubAPIClient", full_url: str, owner: str, repo: str, number: str) -> str | None:
+    """Get the status of a PR, or None if it could not be checked."""
+    logger.info(f"Checking status for PR: {full_url}")
+    try:
+        pr_details = client.get_pull_request_details(owner, repo, int(number))
+    except Exception as e:
+        logger.error(f"Failed to check status for {full_url}: {e}")
+        return None
+
+    if pr_details.get("merged"):
+        return "merged"
+    return pr_details.get("state", "unknown")
 
 
 def update_pr_statuses(client: "GitHubAPIClient"):
-    """Update the status of all PRs in the tracker file."""
+    """Update the status of all PRs in the tracker file.
+
+    All PR links are collected first so their statuses can be fetched concurrently, then the file is rewritten once.
+    """
     path = Path(TRACKER_FILE)
-    if not path.exists():
+    logger.info(f"Reading {TRACKER_FILE}...")
+    try:
+        lines = path.read_text().splitlines(keepends=True)
+    except FileNotFoundError:
         logger.warning(f"{TRACKER_FILE} does not exist.")
         return
 
-    logger.info(f"Reading {TRACKER_FILE}...")
-    with open(path, "r") as f:
-        lines = f.readlines()
-
-    new_lines = []
-    updated_count = 0
+    tasks = []
+    for idx, line in enumerate(lines):
+        # Rows always start at column 0, and only PR rows link to a `/pull/` URL
+        if line[:1] == "|" and "/pull/" in line:
+            match = PR_LINK_PATTERN.search(line)
+            if match:
+                tasks.append((idx, *match.groups()))
 
-    # Regex to find PR link: [url](url)
-    # And specifically https://github.com/owner/repo/pull/number
-    pr_pattern = re.compile(r"\[.*?\]\((https://github\.com/([^/]+)/([^/]+)/pull/(\d+))\)")
+    with ThreadPoolExecutor(max_workers=STATUS_CONCURRENCY) as executor:
+        statuses = list(executor.map(lambda task: _fetch_pr_status(client, *task[1:]), tasks))
 
-    for line in lines:
-        if line.strip().startswith("|") and "github.com" in line:
-            match = pr_pattern.search(line)
-            if match:
-                full_url, owner, repo, number = match.groups()
-                logger.info(f"Checking status for PR: {full_url}")
-
-                try:
-                    pr_details = client.get_pull_request_details(owner, repo, int(number))
-
-                    if pr_details.get("merged"):
-                        status = "merged"
-                    else:
-                        status = pr_details.get("state", "unknown")
-
-                    # Update line
-                    # Assuming format | Date | Repo | PR | Status |
-                    parts = line.split("|")
-                    if len(parts) >= 5:
-                        current_status = parts[4].strip()
-                        if current_status != status:
-                            # Preserve padding if possible, or just space it
-                            parts[4] = f" {status} "
-                            line = "|".join(parts)
-                            updated_count += 1
-                            logger.info(f"Updated status for {owner}/{repo}#{number}: {current_status} -> {status}")
-                        else:
-                            logger.info(f"Status unchanged for {owner}/{repo}#{number}: {status}")
-                except Exception as e:
-                    logger.error(f"Failed to check status for {full_url}: {e}")
-
-        new_lines.append(line)
+    updated_count = 0
+    for (idx, _, owner, repo, number), status in zip(tasks, statuses, strict=True):
+        if status is None:
+            continue
+
+        # Assuming format | Date | Repo | PR | Status |
+        parts = lines[idx].split("|")
+        if len(parts) >= 5:
+            current_status = parts[4].strip()
+            if current_status != status:
+                # Preserve padding if possible, or just space it
+                parts[4] = f" {status} "
+                lines[idx] = "|".join(parts)
+                updated_count += 1
+                logger.info(f"Updated status for {owner}/{repo}#{number}: {current_status} -> {status}")
+            else:
+                logger.info(f"Status unchanged for {owner}/{repo}#{number}: {status}")
 
     if updated_count > 0:
-        with open(path, "w") as f:
-            f.writelines(new_lines)
+        path.write_text("".join(lines))
         logger.info(f"Updated {updated_count} PR statuses in {TRACKER_FILE}.")
     else:
         logger.info("No statuses needed updating.")
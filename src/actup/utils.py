@@ -1,87 +1,164 @@
 import json
+import logging
 import os
 import re
 import shutil
 import subprocess
+import tempfile
+from collections import defaultdict
 from pathlib import Path
 
 import ollama
 import yaml
-from git import Repo
 
 from actup.config import settings
 from actup.logger import logger
 
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:  # PyYAML built without libyaml
+    from yaml import SafeLoader
 
-def deduplicate_list(input_list):
-    """Deduplicate a list of elements."""
-    seen = set()
-    deduplicated_list = []
-    for item in input_list:
-        if isinstance(item, (list, dict, set)) and not isinstance(item, frozenset):
-            deduplicated_list.append(item)
-        elif item not in seen:
-            seen.add(item)
-            deduplicated_list.append(item)
-    return deduplicated_list
+OLLAMA_KEEP_ALIVE = "30m"
+
+ACTION_VERSION_PATTERN = re.compile(r"uses:\s+([a-zA-Z0-9_\-]+/[a-zA-Z0-9_\-]+)@([a-zA-Z0-9_\-\.]+)")
+# Only unquoted references, as those are the only ones `replace_action_references_in_content` can rewrite
+USES_LINE_PATTERN = re.compile(
+    rb"^[ \t]*(?:-[ \t]*)?uses:[ \t]+([a-zA-Z0-9_\-]+/[a-zA-Z0-9_\-]+)@([a-zA-Z0-9_\-\.]+)", re.MULTILINE
+)
+# A key whose value is a literal or folded block scalar, e.g. `- run: |`, capturing everything before the key
+BLOCK_SCALAR_HEADER_PATTERN = re.compile(
+    rb"^([ \t]*(?:-[ \t]+)?)[^\s#][^\n]*?:[ \t]+[|>][-+0-9]*[ \t]*(?:#.*)?$", re.MULTILINE
+)
+
+# The `user:token@` part of a URL
+URL_CREDENTIALS_PATTERN = re.compile(r"(\w+://)[^/@\s]+@")
+
+# Models confirmed to be available locally, so each PR does not re-check with the Ollama server
+_loaded_models: set[str] = set()
+
+
+class GitCommandError(subprocess.CalledProcessError):
+    """A failed git command, reported with git's error output and with URL credentials redacted."""
+
+    def __str__(self) -> str:
+        """Describe the failure, including what git printed."""
+        return f"{super().__str__()} {self.stderr}"
 
 
-def git_clone_shallow(repo_url: str, target_dir: str):
+def _redact_credentials(text: str) -> str:
+    return URL_CREDENTIALS_PATTERN.sub(r"\1***@", text)
+
+
+def _git(*args: str, input: bytes | None = None) -> bytes:
+    """Run a git command, returning its standard output."""
+    result = subprocess.run(["git", *args], input=input, capture_output=True)
+    if result.returncode != 0:
+        # Clone URLs can carry a token, which must not end up in logs through the command or git's message
+        raise GitCommandError(
+            result.returncode,
+            ["git", *map(_redact_credentials, args)],
+            stderr=_redact_credentials(result.stderr.decode(errors="replace").strip()),
+        )
+    return result.stdout
+
+
+def git_clone_shallow(repo_url: str, target_dir: str) -> None:
     """Clone a git repository shallowly."""
     if Path(target_dir).exists():
         shutil.rmtree(target_dir)
 
     os.makedirs(target_dir, exist_ok=True)
-    return Repo.clone_from(repo_url, target_dir, depth=1)
+    _git("clone", "--depth=1", repo_url, target_dir)
+
+
+def _read_blobs(git_dir: str, shas: list[str]) -> list[bytes]:
+    """Read several blobs through one `git cat-file --batch` process."""
+    output = _git("-C", git_dir, "cat-file", "--batch", input="".join(f"{sha}\n" for sha in shas).encode())
+    blobs = []
+    pos = 0
+    for _ in shas:
+        header_end = output.index(b"\n", pos)
+        size = int(output[pos:header_end].split()[2])
+        blobs.append(output[header_end + 1 : header_end + 1 + size])
+        pos = header_end + size + 2
+    return blobs
 
 
-def git_clone_sparse(repo_url: str, final_target_dir: str):
-    """Clones a Git repository using sparse checkout."""
+def git_fetch_workflow_files(repo_url: str, final_target_dir: str):
+    """Fetch the `.github/workflows/` YAML files of a repository without checking out a working tree.
+
+    A shallow, blobless, bare clone provides the tree; the workflow blobs are then fetched in a
+    single request and read back through one `git cat-file --batch` process.
+    """
     repo_root_path = Path(final_target_dir)
     if repo_root_path.exists():
         shutil.rmtree(repo_root_path)
+    repo_root_path.mkdir(parents=True)
 
-    repo_root_path.parent.mkdir(parents=True, exist_ok=True)
-    run_git_command(f"git clone --depth 1 --filter=blob:none --no-checkout {repo_url} {str(repo_root_path)}")
-    run_git_command(f"git -C {str(repo_root_path)} sparse-checkout init --cone")
-    run_git_command(f"git -C {str(repo_root_path)} sparse-checkout set .github/")
     try:
-        run_git_command(f"git -C {str(repo_root_path)} checkout main")
-    except Exception:
-        try:
-            run_git_command(f"git -C {str(repo_root_path)} checkout master")
-        except Exception:
+        with tempfile.TemporaryDirectory() as bare_dir:
+            _git("clone", "--bare", "--depth=1", "--filter=blob:none", repo_url, bare_dir)
             try:
-                run_git_command(f"git -C {str(repo_root_path)} checkout develop")
-            except Exception:
-                logger.warning(f"Unable to checkout {repo_url}")
-
-
-def is_major_version_outdated(detected_version: str, latest_version: str) -> bool:
-    """Check if the detected version is older than the latest version."""
-    if not detected_version or not latest_version:
-        return False
+                tree = _git("-C", bare_dir, "ls-tree", "-r", "-z", "HEAD", "--", ".github/workflows")
+            except subprocess.CalledProcessError:  # Empty repository, so there is no HEAD
+                tree = b""
 
-    if isinstance(detected_version, int):
-        detected_version = str(detected_version)
-    if isinstance(latest_version, int):
-        latest_version = str(latest_version)
-
-    try:
-        detected_major = int(detected_version.lstrip("v").split(".")[0])
-        latest_major = int(latest_version.lstrip("v").split(".")[0])
-        return detected_major < latest_major
-    except ValueError:
-        return False
+            blobs = {}
+            for entry in tree.decode().split("\0"):
+                if not entry:
+                    continue
+                meta, path = entry.split("\t", 1)
+                _, object_type, sha = meta.split()
+                if object_type == "blob" and path.endswith((".yml", ".yaml")):
+                    blobs[path] = sha
+            if not tree:
+                logger.warning(f"No .github/workflows directory found in {repo_url}")
+                return
+            if not blobs:
+                return
+
+            # Mirrors the command git itself uses to backfill missing objects in a partial clone
+            _git(
+                "-C",
+                bare_dir,
+                "-c",
+                "fetch.negotiationAlgorithm=noop",
+                "fetch",
+                "--no-tags",
+                "--no-write-fetch-head",
+                "--recurse-submodules=no",
+                "--filter=blob:none",
+                "origin",
+                *blobs.values(),
+            )
+            for path, data in zip(blobs, _read_blobs(bare_dir, list(blobs.values())), strict=True):
+                target = repo_root_path / path
+                target.parent.mkdir(parents=True, exist_ok=True)
+                target.write_bytes(data)
+    except Exception:
+        # A half-fetched directory would pass for a finished fetch and be skipped by later runs
+        shutil.rmtree(repo_root_path, ignore_errors=True)
+        raise
 
 
 def load_ollama_model(model_name: str) -> None:
     """Load the Ollama model, If not already present, download it."""
-    logger.debug(f"Attempting to pull model: {model_name}. This may take a while if not cached.")
-    pull_response = ollama.pull(model_name, stream=True)
-    for chunk in pull_response:
-        if "status" in chunk:
-            logger.debug(f"Pull Status: {chunk['status']}")
+    if model_name in _loaded_models:
+        return
+
+    try:
+        ollama.show(model_name)
+    except ollama.ResponseError:
+        logger.debug(f"Attempting to pull model: {model_name}. This may take a while.")
+        if logger.isEnabledFor(logging.DEBUG):
+            for chunk in ollama.pull(model_name, stream=True):
+                if "status" in chunk:
+                    logger.debug(f"Pull Status: {chunk['status']}")
+        else:
+            # Nothing would log the progress updates, so only wait for the pull to finish
+            ollama.pull(model_name)
+    _loaded_models.add(model_name)
 
 
 def merge_pr_body_into_template(pr_body: str, pull_request_template_body: str) -> str:
@@ -119,136 +196,221 @@ def merge_pr_body_into_template(pr_body: str, pull_request_template_body: str) -
         },
         prompt=prompt,
         stream=False,
-    ).response
+        # Keeps the model resident between the PRs of a batch run
+        keep_alive=OLLAMA_KEEP_ALIVE,
+    )
     logger.info("Response received from Ollama...")
-    return response
+    # A cut-off or empty answer would be posted to someone else's repository, so the plain body is safer
+    merged_body = response.response
+    if response.done_reason == "length" or not merged_body or not merged_body.strip():
+        logger.warning(f"Ollama response was incomplete ({response.done_reason}), using the PR body without template.")
+        return pr_body
+    return merged_body
 
 
 def parse_action_version(action_line: str) -> tuple[str, str] | None:
     """Parse the action name and version from a line."""
-    pattern = r"uses:\s+([a-zA-Z0-9_\-]+/[a-zA-Z0-9_\-]+)@([a-zA-Z0-9_\-\.]+)"
-    match = re.search(pattern, action_line)
+    # A substring check rejects most lines (blank, comments, other keys) without running the regex
+    if "uses:" not in action_line:
+        return None
+    match = ACTION_VERSION_PATTERN.search(action_line)
     if match:
         return match.group(1), match.group(2)
     return None
 
 
-def replace_action_version_in_content(content: str, action_name: str, old_version: str, new_version: str) -> str:
-    """Replace the action version in the content."""
-    pattern = f"uses: {action_name}@{old_version}"
-    replacement = f"uses: {action_name}@{new_version}"
-    return content.replace(pattern, replacement)
+def _block_scalar_bodies(content: bytes) -> list[tuple[int, int]]:
+    """Get the (start, end) offsets of every block scalar body, e.g. the script of a `run: |` step.
+
+    A body runs until the first non-blank line indented no deeper than its key.
+    """
+    bodies = []
+    for header in BLOCK_SCALAR_HEADER_PATTERN.finditer(content):
+        key_indent = len(header[1])
+        start = end = header.end() + 1
+        while end < len(content):
+            line_end = content.find(b"\n", end)
+            if line_end == -1:
+                line_end = len(content)
+            line = content[end:line_end]
+            stripped = line.lstrip(b" \t")
+            if stripped and len(line) - len(stripped) <= key_indent:
+                break
+            end = line_end + 1
+        bodies.append((start, end))
+    return bodies
+
+
+def _in_block_scalar(bodies: list[tuple[int, int]], position: int) -> bool:
+    return any(start <= position < end for start, end in bodies)
+
+
+def replace_action_references_in_content(content: bytes, replacements: dict[str, str]) -> tuple[bytes, set[str]]:
+    """Replace several `<action>@<version>` references in a single pass over the raw file content.
+
+    References are only replaced as the unquoted value of a `uses:` key outside a block scalar, either on its own
+    line as `scan_content_for_uses_lines` finds it or in a flow mapping such as `steps: [{uses: ...}]` as the YAML
+    fallback of `search_and_extract_actions` finds it. They must be followed by the end of the version, so `@v3` does
+    not also rewrite `@v3.1`.
+
+    Returns:
+        A tuple of (new content, references that were replaced).
+
+    """
+    encoded = {old.encode(): new.encode() for old, new in replacements.items()}
+    alternation = b"|".join(re.escape(old) for old in sorted(encoded, key=len, reverse=True))
+    pattern = re.compile(
+        rb"((?:^[ \t]*(?:-[ \t]*)?|[{,][ \t]*)uses:[ \t]+)(" + alternation + rb")(?![\w.\-])", re.MULTILINE
+    )
+    bodies = _block_scalar_bodies(content)
+    replaced = set()
+
+    def replace(match: re.Match[bytes]) -> bytes:
+        if _in_block_scalar(bodies, match.start()):
+            return match[0]
+        replaced.add(match[2].decode())
+        return match[1] + encoded[match[2]]
+
+    return pattern.sub(replace, content), replaced
+
+
+def index_action_lines(file_content: str) -> dict[str, list[tuple[int, str, str]]]:
+    """Map each action used in a file to the (line number, name, version) of every line that uses it."""
+    index = defaultdict(list)
+    for i, line in enumerate(file_content.splitlines()):
+        parsed = parse_action_version(line)
+        if parsed:
+            name, version = parsed
+            index[name].append((i + 1, name, version))
+    return index
 
 
-def run_git_command(command: str) -> None:
-    """Run a git command using subprocess."""
-    subprocess.run(command.split(" "), check=True, capture_output=True, text=True)
+def lookup_action_lines(action_lines: dict[str, list[tuple[int, str, str]]], uses: str) -> list[tuple[int, str, str]]:
+    """Get the indexed lines for a `uses` value, preferring lines with its exact version over other versions."""
+    name, _, version = uses.partition("@")
+    lines = action_lines.get(name, [])
+    return [line for line in lines if line[2] == version] or lines
 
 
-def scan_file_for_action_line_number(file_content: str, action: str) -> list[tuple[int, str, str]]:
-    """Identify the line number in a file where an action is used."""
+def is_scan_current(repo_full_name: str) -> bool:
+    """Check whether a repository's saved action usage is newer than its fetched workflow files."""
+    repo_dir = Path(settings.temp_dir) / "cloned_repos" / repo_full_name.replace("/", "_")
+    usage_file = Path(settings.temp_dir) / "action_usage" / repo_full_name / "actions_used.json"
+    try:
+        scanned_at = usage_file.stat().st_mtime
+        workflows_dir = repo_dir / ".github" / "workflows"
+        fetched_at = (workflows_dir if workflows_dir.exists() else repo_dir).stat().st_mtime
+    except FileNotFoundError:
+        return False
+    return scanned_at >= fetched_at
+
+
+def scan_content_for_uses_lines(content: bytes) -> list[tuple[int, str, str]]:
+    """Find every `uses: owner/repo@version` line in file content without parsing it as YAML.
+
+    Lines inside block scalars, such as the script of a `run: |` step, are skipped.
+    """
     results = []
-    lines = file_content.splitlines()
-    for i, line in enumerate(lines):
-        parsed = parse_action_version(line)
-        if parsed:
-            name, version = parsed
-            if name == action:
-                results.append((i + 1, name, version))
+    line_number = 1
+    position = 0
+    bodies = None
+    for match in USES_LINE_PATTERN.finditer(content):
+        line_number += content.count(b"\n", position, match.start())
+        position = match.start()
+        if bodies is None:
+            bodies = _block_scalar_bodies(content)
+        # Script text in e.g. a `run: |` step is not a step of the workflow
+        if _in_block_scalar(bodies, match.start()):
+            continue
+        results.append((line_number, match[1].decode(), match[2].decode()))
     return results
 
 
-def search_and_extract_actions(repo_data):
+def search_and_extract_actions(repo_full_name: str):
     """Search files for GitHub Actions and extract the used actions."""
-    repo_full_name = repo_data.repo_full_name
     repo_dir = Path(settings.temp_dir) / "cloned_repos" / repo_full_name.replace("/", "_")
-    used_actions = []
+    # (action_raw, filepath, (line number, name, version)) per use, with no line when it could not be located
+    used_actions: list[tuple[str, str, tuple[int, str, str] | None]] = []
 
     if not os.path.exists(repo_dir):
         logger.error(f"Directory {repo_dir} does not exist.")
         return
 
-    for dirpath, _, filenames in os.walk(repo_dir):
-        for filename in filenames:
-            if filename.endswith((".yml", ".yaml")):
-                filepath = os.path.join(dirpath, filename)
+    # Only workflow files are fetched, so the walk starts there rather than at the repository root
+    filepaths = [
+        os.path.join(dirpath, filename)
+        for dirpath, _, filenames in os.walk(repo_dir / ".github" / "workflows")
+        for filename in filenames
+        if filename.endswith((".yml", ".yaml"))
+    ]
 
-                try:
-                    with open(filepath, "r", encoding="utf-8") as f:
-                        try:
-                            content_yaml = yaml.safe_load(f)
-                        except yaml.YAMLError:
-                            continue
+    for filepath in filepaths:
+        try:
+            content = Path(filepath).read_bytes()
+        except OSError as e:
+            logger.warning(f"Error processing {filepath}: {e}")
+            continue
 
-                    if not isinstance(content_yaml, dict):
-                        continue
+        regex_actions = scan_content_for_uses_lines(content)
+        if regex_actions:
+            used_actions.extend((f"{line[1]}@{line[2]}", filepath, line) for line in regex_actions)
+            continue
 
-                    # GitHub Actions workflows typically have a 'jobs' key
-                    if "jobs" in content_yaml and isinstance(content_yaml["jobs"], dict):
-                        with open(filepath, "r", encoding="utf-8") as f:
-                            content_raw = f.read()
-
-                        for _, job in content_yaml["jobs"].items():
-                            if not isinstance(job, dict):
-                                continue
-
-                            # Check for reusable workflow invocation
-                            if "uses" in job:
-                                used_actions.append(
-                                    {
-                                        "action_raw": job["uses"],
-                                        "filepath": filepath,
-                                        "line_numbers": scan_file_for_action_line_number(
-                                            file_content=content_raw, action=job["uses"][: job["uses"].find("@")]
-                                        ),
-                                    }
-                                )
-
-                            if "steps" in job and isinstance(job["steps"], list):
-                                used_actions.extend(
-                                    {
-                                        "action_raw": step["uses"],
-                                        "filepath": filepath,
-                                        "line_numbers": scan_file_for_action_line_number(
-                                            file_content=content_raw, action=step["uses"][: step["uses"].find("@")]
-                                        ),
-                                    }
-                                    for step in job["steps"]
-                                    if isinstance(step, dict) and "uses" in step
-                                )
-
-                except Exception as e:
-                    logger.warning(f"Error processing {filepath}: {e}")
-                    continue
+        # Fall back to parsing the YAML for files the line scan could not read, e.g. flow-style steps
+        try:
+            try:
+                content_yaml = yaml.load(content, Loader=SafeLoader)
+            except yaml.YAMLError:
+                continue
 
-    used_actions_per_line = []
-    for i in used_actions:
-        i["repo_full_name"] = repo_full_name
-        used_actions_per_line.extend(split_dict_by_line_numbers(i))
+            if not isinstance(content_yaml, dict):
+                continue
 
-    for i in used_actions:
-        i["action_name"] = i["line_numbers"][0][1] if i.get("line_numbers") else "Unknown"
-        i["action_version"] = i["line_numbers"][0][2] if i.get("line_numbers") else "Unknown"
-        i["line_number"] = i["line_numbers"][0][0] if i.get("line_numbers") else -1
-        i.pop("line_numbers")
+            # GitHub Actions workflows typically have a 'jobs' key
+            if "jobs" in content_yaml and isinstance(content_yaml["jobs"], dict):
+                # One pass over the lines serves the lookups of every job and step below
+                action_lines = index_action_lines(content.decode("utf-8"))
 
-    dir = f"./{settings.temp_dir}/action_usage/{repo_full_name}"
-    Path(dir).mkdir(exist_ok=True, parents=True)
-    with open(f"{dir}/actions_used.json", "w") as f:
-        json.dump(deduplicate_list(used_actions), f)
+                for _, job in content_yaml["jobs"].items():
+                    if not isinstance(job, dict):
+                        continue
 
+                    # Check for reusable workflow invocation
+                    if "uses" in job:
+                        lines = lookup_action_lines(action_lines, job["uses"])
+                        used_actions.append((job["uses"], filepath, lines[0] if lines else None))
 
-def split_dict_by_line_numbers(original_dict):
-    """Take a dict that has a nested list and return multiple dicts."""
-    new_dicts = []
-    line_numbers_list = original_dict.get("line_numbers", [])
+                    if "steps" in job and isinstance(job["steps"], list):
+                        for step in job["steps"]:
+                            if isinstance(step, dict) and "uses" in step:
+                                lines = lookup_action_lines(action_lines, step["uses"])
+                                used_actions.append((step["uses"], filepath, lines[0] if lines else None))
 
-    # Create a base dictionary with all keys except 'line_numbers'
-    base_dict = {k: v for k, v in original_dict.items() if k != "line_numbers"}
+        except Exception as e:
+            logger.warning(f"Error processing {filepath}: {e}")
+            continue
 
-    for line_info_tuple in line_numbers_list:
-        new_entry = base_dict.copy()
-        new_entry["line_numbers"] = line_info_tuple
-        new_dicts.append(new_entry)
+    # The remaining fields all follow from the line, so this key identifies a row
+    seen = set()
+    unique_actions = []
+    for action_raw, filepath, line in used_actions:
+        line_number, action_name, action_version = line or (-1, "Unknown", "Unknown")
+        key = (action_raw, filepath, line_number)
+        if key not in seen:
+            seen.add(key)
+            # Rows are only built as dicts here, once deduplicated, for the JSON dump
+            unique_actions.append(
+                {
+                    "action_raw": action_raw,
+                    "filepath": filepath,
+                    "repo_full_name": repo_full_name,
+                    "action_name": action_name,
+                    "action_version": action_version,
+                    "line_number": line_number,
+                }
+            )
 
-    return new_dicts
+    dir = f"./{settings.temp_dir}/action_usage/{repo_full_name}"
+    Path(dir).mkdir(exist_ok=True, parents=True)
+    # `json.dumps` encodes in one call to the C encoder, where `json.dump` writes each encoded fragment separately
+    Path(f"{dir}/actions_used.json").write_text(json.dumps(unique_actions, separators=(",", ":")))
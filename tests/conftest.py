@@ -1,19 +1,12 @@
-import os
-
 import pytest
 
 from actup.database import Database
 
 
 @pytest.fixture
-def test_db():
-    """Create a test database fixture."""
-    test_db_file = "test_db.duckdb"
-    if os.path.exists(test_db_file):
-        os.remove(test_db_file)
-
-    db = Database(test_db_file)
+def test_db(tmp_path):
+    """Create a test database fixture in a per-test directory, so parallel workers never share a file."""
+    db = Database(str(tmp_path / "test.duckdb"))
     yield db
+    # Also evicts the shared connection, so a later `Database` for the same path does not reuse a closed one
     db.close()
-    if os.path.exists(test_db_file):
-        os.remove(test_db_file)
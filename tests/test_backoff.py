@@ -0,0 +1,100 @@
+import time
+from email.utils import formatdate
+
+import httpx
+import pytest
+
+from actup import backoff
+from actup.backoff import _rate_limit_wait, retry_with_backoff
+
+
+def _http_error(status_code, headers=None):
+    request = httpx.Request("GET", "https://api.github.com/repos/octo/repo")
+    response = httpx.Response(status_code, headers=headers, request=request)
+    return httpx.HTTPStatusError("error", request=request, response=response)
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Record the waits requested by `retry_with_backoff` instead of sleeping."""
+    calls = []
+    monkeypatch.setattr(backoff.time, "sleep", calls.append)
+    return calls
+
+
+def test_retry_with_backoff_retries_until_success(sleeps):
+    """Test that failures are retried with exponential backoff until the call succeeds."""
+    results = iter([ValueError("first"), ValueError("second"), "ok"])
+
+    @retry_with_backoff(tries=3, delay=2, max_delay=3)
+    def flaky():
+        result = next(results)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    assert flaky() == "ok"
+    assert len(sleeps) == 2
+    assert 1 <= sleeps[0] <= 2
+    assert 1.5 <= sleeps[1] <= 3
+
+
+def test_retry_with_backoff_reraises_after_last_try(sleeps):
+    """Test that the last error is raised once every try has failed."""
+    calls = []
+
+    @retry_with_backoff(tries=3, delay=1)
+    def failing():
+        calls.append(1)
+        raise ValueError(f"attempt {len(calls)}")
+
+    with pytest.raises(ValueError, match="attempt 3"):
+        failing()
+    assert len(calls) == 3
+    assert len(sleeps) == 2
+
+
+def test_retry_with_backoff_waits_for_rate_limit(sleeps):
+    """Test that a rate-limited response waits for as long as GitHub asks rather than backing off."""
+    results = iter([_http_error(429, {"retry-after": "7"}), "ok"])
+
+    @retry_with_backoff(tries=2, delay=1)
+    def limited():
+        result = next(results)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    assert limited() == "ok"
+    assert sleeps == [7.0]
+
+
+def test_rate_limit_wait_reads_retry_after_seconds():
+    """Test that a numeric `Retry-After` header is used as is."""
+    assert _rate_limit_wait(_http_error(429, {"retry-after": "30"})) == 30.0
+
+
+def test_rate_limit_wait_reads_retry_after_http_date():
+    """Test that a `Retry-After` header given as an HTTP-date is turned into seconds from now."""
+    wait = _rate_limit_wait(_http_error(403, {"retry-after": formatdate(time.time() + 60, usegmt=True)}))
+    assert wait is not None
+    assert 55 <= wait <= 60
+
+    past = formatdate(time.time() - 60, usegmt=True)
+    assert _rate_limit_wait(_http_error(403, {"retry-after": past})) == 0.0
+
+
+def test_rate_limit_wait_reads_rate_limit_reset():
+    """Test that an exhausted rate limit waits until `X-RateLimit-Reset`."""
+    headers = {"x-ratelimit-remaining": "0", "x-ratelimit-reset": str(int(time.time()) + 120)}
+    wait = _rate_limit_wait(_http_error(403, headers))
+    assert wait is not None
+    assert 115 <= wait <= 120
+
+
+def test_rate_limit_wait_ignores_other_errors():
+    """Test that errors other than rate-limited responses fall back to the regular backoff."""
+    assert _rate_limit_wait(ValueError("boom")) is None
+    assert _rate_limit_wait(_http_error(500, {"retry-after": "30"})) is None
+    assert _rate_limit_wait(_http_error(403)) is None
+    assert _rate_limit_wait(_http_error(429, {"retry-after": "soon"})) is None
@@ -1,4 +1,8 @@
-from actup.models import GitHubAction
+import json
+from datetime import datetime, timedelta, timezone
+
+from actup.database import JSON_LOAD_MIN_ROWS, Database
+from actup.models import GitHubAction, GitHubRepo, PullRequestRecord
 
 
 def test_save_popular_action(test_db):
@@ -17,3 +21,225 @@ def test_save_popular_action(test_db):
     assert len(actions) == 1
     assert actions[0].name == "actions/checkout"
     assert actions[0].latest_major_version == "v4"
+
+
+def test_save_popular_actions(test_db):
+    """Test saving multiple popular actions in one batch."""
+    actions = [
+        GitHubAction(
+            name=f"actions/action-{i}",
+            owner="actions",
+            repo=f"action-{i}",
+            stars=i,
+            latest_version="v2.1.0",
+            latest_major_version="v2",
+        )
+        for i in range(3)
+    ]
+    test_db.save_popular_actions(actions)
+
+    saved = test_db.get_popular_actions()
+    assert [a.name for a in saved] == ["actions/action-2", "actions/action-1", "actions/action-0"]
+
+
+def _repo(repo_full_name, stars=1, pushed_at=None):
+    return GitHubRepo(
+        repo_full_name=repo_full_name,
+        clone_url=f"https://github.com/{repo_full_name}.git",
+        stars=stars,
+        archived=False,
+        pushed_at=pushed_at or datetime.now(),
+        fork=False,
+        size=1,
+    )
+
+
+def test_save_popular_repo_replaces_existing_row(test_db):
+    """Test that saving a repo again replaces its row and stores aware datetimes as UTC."""
+    pushed_at = datetime(2026, 1, 1, 12, 0, tzinfo=timezone(timedelta(hours=2)))
+    for stars in (1, 2):
+        test_db.save_popular_repo(_repo("octo/repo", stars=stars, pushed_at=pushed_at))
+
+    rows = test_db.con.execute("SELECT stars, pushed_at FROM popular_repositories").fetchall()
+    assert rows == [(2, datetime(2026, 1, 1, 10, 0))]
+
+
+def test_save_pr_records_stores_aware_datetimes_as_utc(test_db):
+    """Test that small and large batches, bound and JSON-loaded respectively, keep the last duplicate and store UTC."""
+    created_at = datetime(2026, 1, 1, 12, 0, tzinfo=timezone(timedelta(hours=2)))
+    for count in (1, JSON_LOAD_MIN_ROWS):
+        test_db.con.execute("DELETE FROM pull_requests")
+        prs = [
+            PullRequestRecord(
+                repo_full_name="octo/repo",
+                pr_url=f"https://github.com/octo/repo/pull/{i}",
+                branch_name="actup",
+                created_at=created_at,
+                status=status,
+            )
+            for i in range(count)
+            for status in ("draft", "open")
+        ]
+        test_db.save_pr_records(prs)
+
+        rows = test_db.con.execute("SELECT DISTINCT created_at, status FROM pull_requests").fetchall()
+        assert test_db.con.execute("SELECT count(*) FROM pull_requests").fetchone() == (count,)
+        assert rows == [(datetime(2026, 1, 1, 10, 0), "open")]
+
+
+def test_get_popular_repo_names_skips_excluded_repos(test_db):
+    """Test that repos listed in `exclude_repos` are not returned."""
+    test_db.con.execute("DELETE FROM repo_exclusions")
+    test_db.con.execute("INSERT INTO repo_exclusions VALUES ('octo/excluded')")
+    for repo_full_name in ("octo/kept", "octo/excluded"):
+        test_db.save_popular_repo(_repo(repo_full_name))
+
+    assert test_db.get_popular_repo_names() == ["octo/kept"]
+
+
+def test_save_action_tags_rolls_back_on_error(test_db):
+    """Test that action tags saved inside a failed transaction are discarded."""
+    test_db.save_action_tags([("actions/checkout", "v4.0.0", "abc123")])
+    try:
+        with test_db.transaction():
+            test_db.save_action_tags([("actions/setup-python", "v5.0.0", "def456")])
+            raise RuntimeError("boom")
+    except RuntimeError:
+        pass
+
+    assert test_db.has_action_tags("actions/checkout")
+    assert not test_db.has_action_tags("actions/setup-python")
+
+
+def test_init_db_upserts_seed_rows(test_db):
+    """Test that seed rows are restored on every start, keeping rows added by hand."""
+    test_db.con.execute("DELETE FROM action_exclusions")
+    test_db.con.execute("INSERT INTO action_exclusions VALUES ('octo/custom', 'Added by hand')")
+    test_db.init_db()
+
+    rows = test_db.con.execute("SELECT action_name FROM action_exclusions ORDER BY action_name").fetchall()
+    assert rows == [("actions/labeler",), ("octo/custom",)]
+
+
+def test_database_reuses_connection(test_db):
+    """Test that opening the same database file again reuses the shared connection."""
+    other = Database(test_db.db_file)
+    assert other.con is test_db.con
+
+
+def test_get_outdated_mentions_grouped(test_db):
+    """Test that outdated mentions are grouped by repository."""
+    test_db.con.execute("""
+        CREATE TABLE outdated_actions AS
+        SELECT * FROM (VALUES
+            ('octo/a', 'actions/checkout', 'v3', 'a/ci.yml', 4, 'v4', TRUE),
+            ('octo/a', 'actions/checkout', 'v3', 'a/ci.yml', 2, 'v4', TRUE),
+            ('octo/b', 'actions/checkout', 'v3', 'b/ci.yml', 7, 'v4', TRUE),
+            ('octo/c', 'actions/checkout', 'v4', 'c/ci.yml', 1, 'v4', FALSE),
+            ('octo/d', 'actions/labeler', 'v4', 'd/ci.yml', 3, 'v5', TRUE),
+            ('expo/expo', 'actions/checkout', 'v3', 'e/ci.yml', 5, 'v4', TRUE)
+        ) t(repo_full_name, action_name, action_version, filepath, line_number, latest_major_version, is_outdated)
+    """)
+
+    grouped = test_db.get_outdated_mentions_grouped()
+    assert sorted(grouped) == ["octo/a", "octo/b"]
+    assert [m.line_number for m in grouped["octo/a"]] == [2, 4]
+    assert grouped["octo/b"][0].file_path == "b/ci.yml"
+
+    test_db.add_repo_to_pr_exclusions("octo/b")
+    assert sorted(test_db.get_outdated_mentions_grouped()) == ["octo/a"]
+
+
+def test_find_outdated_actions(test_db):
+    """Test that used actions are flagged as outdated by major version."""
+    test_db.save_popular_actions(
+        [
+            GitHubAction(
+                name="actions/checkout",
+                owner="actions",
+                repo="checkout",
+                stars=1,
+                latest_version="v4.1.0",
+                latest_major_version="v4",
+            )
+        ]
+    )
+    test_db.con.execute("""
+        CREATE TABLE action_usage AS
+        SELECT * FROM (VALUES
+            ('octo/a', 'actions/checkout', 'v3.5.2', 'a/ci.yml', 1),
+            ('octo/a', 'actions/checkout', 'v4', 'a/ci.yml', 2),
+            ('octo/a', 'actions/checkout', 'vmain', 'a/ci.yml', 3),
+            ('octo/a', 'actions/unknown', 'v1', 'a/ci.yml', 4)
+        ) t(repo_full_name, action_name, action_version, filepath, line_number)
+    """)
+
+    test_db.find_outdated_actions()
+
+    rows = test_db.con.execute("SELECT line_number, is_outdated FROM outdated_actions ORDER BY line_number").fetchall()
+    assert rows == [(1, True), (2, False), (3, False), (4, False)]
+
+
+def test_get_actions_with_tags(test_db):
+    """Test retrieving the set of actions with stored tags."""
+    test_db.save_action_tags(
+        [
+            ("actions/checkout", "v4.0.0", "abc123"),
+            ("actions/checkout", "v4.1.0", "def456"),
+            ("actions/setup-python", "v5.0.0", "0a1b2c"),
+        ]
+    )
+
+    assert test_db.get_actions_with_tags() == {"actions/checkout", "actions/setup-python"}
+
+
+def test_init_db_adds_missing_commit_sha_column(test_db):
+    """Test that re-initialising an older schema adds the commit_sha columns."""
+    test_db.con.execute("ALTER TABLE popular_actions DROP COLUMN commit_sha")
+    test_db.init_db()
+
+    columns = {r[0] for r in test_db.con.execute("DESCRIBE popular_actions").fetchall()}
+    assert "commit_sha" in columns
+
+
+def test_init_db_backfills_action_name(test_db):
+    """Test that re-initialising a schema without `action_name` fills it from owner and repo."""
+    test_db.save_popular_action(
+        GitHubAction(
+            name="Checkout",
+            owner="actions",
+            repo="checkout",
+            stars=1,
+            latest_version="v4.1.0",
+            latest_major_version="v4",
+        )
+    )
+    test_db.con.execute("ALTER TABLE popular_actions DROP COLUMN action_name")
+    test_db.init_db()
+
+    assert test_db.con.execute("SELECT action_name FROM popular_actions").fetchall() == [("actions/checkout",)]
+
+
+def test_save_popular_repos_json_keeps_most_starred_duplicate(test_db, tmp_path):
+    """Test loading repos from newline-delimited JSON, keeping the most starred row of a repeated repo."""
+    path = tmp_path / "repos.ndjson"
+    path.write_text(
+        "\n".join(
+            json.dumps(
+                {
+                    "repo_full_name": "octo/repo",
+                    "clone_url": "https://github.com/octo/repo.git",
+                    "stars": stars,
+                    "archived": False,
+                    "pushed_at": "2026-01-01T12:00:00Z",
+                    "fork": False,
+                    "size": 1,
+                }
+            )
+            for stars in (2, 1)
+        )
+    )
+    test_db.save_popular_repos_json(str(path))
+
+    rows = test_db.con.execute("SELECT stars, pushed_at FROM popular_repositories").fetchall()
+    assert rows == [(2, datetime(2026, 1, 1, 12, 0))]
@@ -0,0 +1,112 @@
+import json
+
+import httpx
+import pytest
+
+from actup import github_api
+from actup.github_api import GitHubAPIClient
+
+
+def _pr(number, author, paths, has_next_page=False):
+    files = (
+        None if paths is None else {"nodes": [{"path": p} for p in paths], "pageInfo": {"hasNextPage": has_next_page}}
+    )
+    return {
+        "number": number,
+        "title": f"PR {number}",
+        "url": f"https://github.com/octo/repo/pull/{number}",
+        "author": {"login": author} if author else None,
+        "files": files,
+    }
+
+
+GRAPHQL_PAGES = {
+    None: {
+        "nodes": [
+            _pr(1, "alice", ["README.md", ".github/workflows/ci.yml"]),
+            _pr(2, None, [".github/workflows/release.yaml"]),
+            _pr(3, "bob", ["src/app.py"]),
+        ],
+        "pageInfo": {"endCursor": "cursor-1", "hasNextPage": True},
+    },
+    "cursor-1": {
+        "nodes": [
+            _pr(4, "carol", ["docs/index.md"], has_next_page=True),
+            _pr(5, "dave", None),
+        ],
+        "pageInfo": {"endCursor": None, "hasNextPage": False},
+    },
+}
+
+REST_FILES = {
+    (4, "2"): [{"filename": ".github/workflows/lint.yml"}],
+    (5, "1"): [{"filename": ".github/actions/setup/action.yml"}],
+}
+
+
+def _handler(request: httpx.Request) -> httpx.Response:
+    if request.url.path == "/graphql":
+        variables = json.loads(request.content)["variables"]
+        assert (variables["owner"], variables["name"]) == ("octo", "repo")
+        return httpx.Response(200, json={"data": {"repository": {"pullRequests": GRAPHQL_PAGES[variables["cursor"]]}}})
+
+    number = int(request.url.path.split("/")[-2])
+    return httpx.Response(200, json=REST_FILES[(number, request.url.params["page"])])
+
+
+@pytest.fixture
+def api_client():
+    """Create a GitHub API client backed by a mock transport."""
+    client = GitHubAPIClient()
+    client.client = httpx.Client(base_url="https://api.github.com", transport=httpx.MockTransport(_handler))
+    return client
+
+
+def test_find_workflow_yaml_prs(api_client):
+    """Test paging through open PRs over GraphQL, falling back to REST for PRs with incomplete file lists."""
+    prs = api_client.find_workflow_yaml_prs("octo/repo")
+
+    assert [(pr["number"], pr["file_modified"], pr["author"]) for pr in prs] == [
+        (1, ".github/workflows/ci.yml", "alice"),
+        (2, ".github/workflows/release.yaml", "ghost"),
+        (4, ".github/workflows/lint.yml", "carol"),
+    ]
+    assert prs[0]["html_url"] == "https://github.com/octo/repo/pull/1"
+    assert prs[0]["title"] == "PR 1"
+
+
+def test_graphql_raises_on_errors(api_client):
+    """Test that GraphQL errors returned with a 200 response raise."""
+    api_client.client = httpx.Client(
+        base_url="https://api.github.com",
+        transport=httpx.MockTransport(lambda request: httpx.Response(200, json={"errors": [{"message": "boom"}]})),
+    )
+
+    with pytest.raises(RuntimeError, match="boom"):
+        api_client.find_workflow_yaml_prs("octo/repo")
+
+
+def test_make_request_reuses_cached_body_and_evicts_least_recently_used(api_client, monkeypatch):
+    """Test that a 304 returns the cached body and that the ETag cache keeps only the most recent responses."""
+    monkeypatch.setattr(github_api, "ETAG_CACHE_SIZE", 2)
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append((request.url.path, request.headers.get("if-none-match")))
+        etag = f'"{request.url.path}"'
+        if request.headers.get("if-none-match") == etag:
+            return httpx.Response(304)
+        return httpx.Response(200, json={"path": request.url.path}, headers={"etag": etag})
+
+    api_client.client = httpx.Client(base_url="https://api.github.com", transport=httpx.MockTransport(handler))
+    for path in ("/a", "/b", "/a", "/c", "/a", "/b"):
+        assert api_client._make_request("GET", path) == {"path": path}
+
+    assert requests == [
+        ("/a", None),
+        ("/b", None),
+        ("/a", '"/a"'),
+        ("/c", None),
+        ("/a", '"/a"'),
+        ("/b", None),
+    ]
@@ -0,0 +1,95 @@
+from actup.utils import replace_action_references_in_content, scan_content_for_uses_lines
+
+WORKFLOW = b"""name: CI
+on: push
+jobs:
+  test:
+    runs-on: ubuntu-latest
+    steps:
+      - uses: actions/checkout@v3
+      - name: Set up Python
+        uses: actions/setup-python@v4
+      - uses: "actions/cache@v3"
+      - run: |
+          echo "uses: fake/thing@v1"
+          uses: fake/other@v2
+        shell: bash
+      - uses: actions/upload-artifact@v3.1
+"""
+
+
+def test_scan_content_for_uses_lines():
+    """Test that unquoted `uses:` lines are found with their line numbers, skipping quoted refs and scripts."""
+    assert scan_content_for_uses_lines(WORKFLOW) == [
+        (7, "actions/checkout", "v3"),
+        (9, "actions/setup-python", "v4"),
+        (15, "actions/upload-artifact", "v3.1"),
+    ]
+
+
+def test_scan_content_for_uses_lines_after_folded_scalar():
+    """Test that a block scalar ends at the first line indented no deeper than its key."""
+    content = b"jobs:\n  a:\n    description: >-\n      uses: fake/thing@v1\n    uses: octo/reusable@v1\n"
+    assert scan_content_for_uses_lines(content) == [(5, "octo/reusable", "v1")]
+
+
+def test_replace_action_references_in_content_respects_version_boundary():
+    """Test that `@v3` is not rewritten inside `@v3.1` or `@v3-beta`."""
+    content = b"- uses: actions/checkout@v3\n- uses: actions/checkout@v3.1\n- uses: actions/checkout@v3-beta\n"
+    new_content, replaced = replace_action_references_in_content(
+        content, {"actions/checkout@v3": "actions/checkout@v4"}
+    )
+
+    assert (
+        new_content == b"- uses: actions/checkout@v4\n- uses: actions/checkout@v3.1\n- uses: actions/checkout@v3-beta\n"
+    )
+    assert replaced == {"actions/checkout@v3"}
+
+
+def test_replace_action_references_in_content_matches_scanned_lines():
+    """Test that only references the scanner reports are rewritten, and only those are returned as replaced."""
+    new_content, replaced = replace_action_references_in_content(
+        WORKFLOW,
+        {
+            "actions/checkout@v3": "actions/checkout@v4",
+            "actions/cache@v3": "actions/cache@v4",
+            "fake/other@v2": "fake/other@v3",
+        },
+    )
+
+    assert b"      - uses: actions/checkout@v4\n" in new_content
+    assert b'"actions/cache@v3"' in new_content
+    assert b"          uses: fake/other@v2\n" in new_content
+    assert replaced == {"actions/checkout@v3"}
+
+
+def test_replace_action_references_in_content_applies_all_replacements_in_one_pass():
+    """Test that each reference is rewritten once, longest match first, keeping the spacing after `uses:`."""
+    content = b"- uses: actions/checkout@v3\n- uses:  actions/checkout@v3.1\n- uses: actions/cache@v1\n"
+    new_content, replaced = replace_action_references_in_content(
+        content,
+        {
+            "actions/checkout@v3": "actions/checkout@v4",
+            "actions/checkout@v3.1": "actions/checkout@abc123 #v3.1",
+            "actions/cache@v1": "actions/cache@v2",
+            "actions/cache@v2": "actions/cache@v3",
+        },
+    )
+
+    assert new_content == (
+        b"- uses: actions/checkout@v4\n- uses:  actions/checkout@abc123 #v3.1\n- uses: actions/cache@v2\n"
+    )
+    assert replaced == {"actions/checkout@v3", "actions/checkout@v3.1", "actions/cache@v1"}
+
+
+def test_replace_action_references_in_content_rewrites_flow_style_steps():
+    """Test that steps written as flow mappings, which only the YAML fallback detects, are rewritten too."""
+    content = b"jobs:\n  a:\n    steps: [{uses: actions/checkout@v3}, {name: Cache, uses: actions/cache@v3}]\n"
+    new_content, replaced = replace_action_references_in_content(
+        content, {"actions/checkout@v3": "actions/checkout@v4", "actions/cache@v3": "actions/cache@v4"}
+    )
+
+    assert new_content == (
+        b"jobs:\n  a:\n    steps: [{uses: actions/checkout@v4}, {name: Cache, uses: actions/cache@v4}]\n"
+    )
+    assert replaced == {"actions/checkout@v3", "actions/cache@v3"}